@@ -1,30 +1,31 @@
 from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks
-from sqlalchemy.orm import Session
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Dict, Any, Optional
 from datetime import datetime, timedelta
 
 from app.core.database import get_db
+from app.core.responses import ORJSONResponse
+from app.core.routing import ORJSONRoute
+from app.api.dependencies import get_benchmark_service
 from app.services.benchmark_service import BenchmarkService, BenchmarkRun
 
-benchmark_router = APIRouter()
+benchmark_router = APIRouter(default_response_class=ORJSONResponse, route_class=ORJSONRoute)
+
+MAX_COMPARE_RUNS = 20
 
 @benchmark_router.post("/benchmark/run")
 async def run_benchmark(
     repository_url: str,
     background_tasks: BackgroundTasks,
     repository_name: Optional[str] = None,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db),
+    benchmark_service: BenchmarkService = Depends(get_benchmark_service)
 ):
     """Start a benchmark run"""
     try:
-        benchmark_service = BenchmarkService()
-        
         # Find predefined repository config or create basic one
-        repo_config = None
-        for repo in benchmark_service.test_repositories:
-            if repository_url in repo['url']:
-                repo_config = repo
-                break
+        repo_config = benchmark_service.find_test_repository(repository_url)
         
         if not repo_config:
             repo_config = {
@@ -58,12 +59,12 @@ async def run_benchmark(
 async def list_benchmark_runs(
     skip: int = 0,
     limit: int = 20,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """List benchmark runs"""
-    runs = db.query(BenchmarkRun).offset(skip).limit(limit).all()
+    runs = (await db.execute(select(BenchmarkRun).offset(skip).limit(limit))).scalars().all()
     
-    return {
+    return ORJSONResponse({
         'runs': [
             {
                 'id': run.id,
@@ -76,17 +77,17 @@ async def list_benchmark_runs(
             }
             for run in runs
         ]
-    }
+    })
 
 @benchmark_router.get("/benchmark/runs/{run_id}")
-async def get_benchmark_run(run_id: int, db: Session = Depends(get_db)):
+async def get_benchmark_run(run_id: int, db: AsyncSession = Depends(get_db)):
     """Get detailed benchmark results"""
-    run = db.query(BenchmarkRun).filter(BenchmarkRun.id == run_id).first()
+    run = await db.get(BenchmarkRun, run_id)
     
     if not run:
         raise HTTPException(status_code=404, detail="Benchmark run not found")
     
-    return {
+    return ORJSONResponse({
         'id': run.id,
         'name': run.name,
         'description': run.description,
@@ -97,58 +98,78 @@ async def get_benchmark_run(run_id: int, db: Session = Depends(get_db)):
         'results': run.results,
         'metrics': run.metrics,
         'error_message': run.error_message
-    }
+    })
 
 @benchmark_router.get("/benchmark/metrics")
 async def get_benchmark_metrics(
     days: int = 30,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Get aggregated benchmark metrics"""
     since = datetime.utcnow() - timedelta(days=days)
     
-    runs = db.query(BenchmarkRun).filter(
+    window = (
         BenchmarkRun.started_at >= since,
         BenchmarkRun.status == "completed"
-    ).all()
+    )
     
-    if not runs:
-        return {'message': 'No completed benchmark runs found'}
+    # Aggregate metrics in the database in one scan; runs without a metric count as 0
+    total_runs, avg_processing_time, avg_quality_score, avg_response_time = (await db.execute(
+        select(
+            func.count(BenchmarkRun.id),
+            func.avg(func.coalesce(BenchmarkRun.metrics['processing_time'].as_float(), 0.0)),
+            func.avg(func.coalesce(BenchmarkRun.metrics['overall_quality_score'].as_float(), 0.0)),
+            func.avg(func.coalesce(BenchmarkRun.metrics['avg_response_time'].as_float(), 0.0))
+        ).where(*window)
+    )).one()
     
-    # Aggregate metrics
-    total_runs = len(runs)
-    avg_processing_time = sum(r.metrics.get('processing_time', 0) for r in runs if r.metrics) / total_runs
-    avg_quality_score = sum(r.metrics.get('overall_quality_score', 0) for r in runs if r.metrics) / total_runs
-    avg_response_time = sum(r.metrics.get('avg_response_time', 0) for r in runs if r.metrics) / total_runs
+    if not total_runs:
+        return ORJSONResponse({'message': 'No completed benchmark runs found'})
     
-    success_rate = len([r for r in runs if r.status == "completed"]) / len(runs) if runs else 0
+    # Only completed runs are selected
+    success_rate = 1.0
     
-    return {
+    # Last 10 runs for trend, oldest first
+    trend_runs = (await db.execute(
+        select(BenchmarkRun.completed_at, BenchmarkRun.metrics).where(*window).order_by(
+            BenchmarkRun.completed_at.desc()
+        ).limit(10)
+    )).all()[::-1]
+    
+    return ORJSONResponse({
         'period_days': days,
         'total_runs': total_runs,
         'success_rate': success_rate,
-        'average_processing_time': avg_processing_time,
-        'average_quality_score': avg_quality_score,
-        'average_response_time': avg_response_time,
+        'average_processing_time': float(avg_processing_time),
+        'average_quality_score': float(avg_quality_score),
+        'average_response_time': float(avg_response_time),
         'trend_data': [
             {
-                'date': run.completed_at.isoformat() if run.completed_at else None,
+                'date': run.completed_at,
                 'quality_score': run.metrics.get('overall_quality_score', 0) if run.metrics else 0,
                 'processing_time': run.metrics.get('processing_time', 0) if run.metrics else 0
             }
-            for run in runs[-10:]  # Last 10 runs for trend
+            for run in trend_runs
         ]
-    }
+    })
 
 @benchmark_router.get("/benchmark/compare")
 async def compare_benchmarks(
     run_ids: str,  # Comma-separated list of run IDs
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Compare multiple benchmark runs"""
     try:
-        ids = [int(id.strip()) for id in run_ids.split(',')]
-        runs = db.query(BenchmarkRun).filter(BenchmarkRun.id.in_(ids)).all()
+        ids = {int(id) for id in run_ids.split(',')}
+        if len(ids) > MAX_COMPARE_RUNS:
+            raise HTTPException(
+                status_code=400,
+                detail=f"At most {MAX_COMPARE_RUNS} runs can be compared at once"
+            )
+        
+        runs = (await db.execute(
+            select(BenchmarkRun).where(BenchmarkRun.id.in_(ids))
+        )).scalars().all()
         
         if not runs:
             raise HTTPException(status_code=404, detail="No benchmark runs found")
@@ -158,6 +179,10 @@ async def compare_benchmarks(
             'metrics_comparison': {}
         }
         
+        # Collect run summaries and key metric values in a single pass
+        metric_keys = ['processing_time', 'avg_response_time', 'overall_quality_score']
+        metric_values = {key: [] for key in metric_keys}
+        
         for run in runs:
             comparison['runs'].append({
                 'id': run.id,
@@ -166,11 +191,12 @@ async def compare_benchmarks(
                 'completed_at': run.completed_at,
                 'metrics': run.metrics
             })
+            if run.metrics:
+                for key in metric_keys:
+                    metric_values[key].append(run.metrics.get(key, 0))
         
         # Compare key metrics
-        metric_keys = ['processing_time', 'avg_response_time', 'overall_quality_score']
-        for key in metric_keys:
-            values = [r.metrics.get(key, 0) for r in runs if r.metrics]
+        for key, values in metric_values.items():
             if values:
                 comparison['metrics_comparison'][key] = {
                     'min': min(values),
@@ -179,7 +205,7 @@ async def compare_benchmarks(
                     'values': values
                 }
         
-        return comparison
+        return ORJSONResponse(comparison)
         
     except ValueError:
         raise HTTPException(status_code=400, detail="Invalid run IDs format")
\ No newline at end of file
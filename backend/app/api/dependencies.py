@@ -0,0 +1,36 @@
+from functools import lru_cache
+
+from app.services.benchmark_service import BenchmarkService
+from app.services.documentation_generator import DocumentationGenerator
+from app.services.github_service import GitHubService
+from app.services.rag_service import RAGService
+from app.services.vector_service import VectorService
+
+# Services hold API clients, tokenizers and embedding models, so build each one
+# once per process and share it across requests. Services that embed queries
+# are handed the shared VectorService so the model is only loaded once.
+
+@lru_cache(maxsize=1)
+def get_github_service() -> GitHubService:
+    return GitHubService()
+
+@lru_cache(maxsize=1)
+def get_vector_service() -> VectorService:
+    return VectorService()
+
+@lru_cache(maxsize=1)
+def get_rag_service() -> RAGService:
+    return RAGService(vector_service=get_vector_service())
+
+@lru_cache(maxsize=1)
+def get_documentation_generator() -> DocumentationGenerator:
+    return DocumentationGenerator()
+
+@lru_cache(maxsize=1)
+def get_benchmark_service() -> BenchmarkService:
+    return BenchmarkService(
+        github_service=get_github_service(),
+        vector_service=get_vector_service(),
+        rag_service=get_rag_service(),
+        doc_generator=get_documentation_generator()
+    )
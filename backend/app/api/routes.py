@@ -1,40 +1,66 @@
-from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks, Query
+from fastapi import APIRouter, Depends, HTTPException, Query
 from fastapi.responses import StreamingResponse
-from sqlalchemy.orm import Session
+from sqlalchemy import delete, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import raiseload
 from typing import List, Dict, Optional
-import json
 import asyncio
+import time
+from collections import OrderedDict
+import orjson
+from datetime import datetime
 from uuid import UUID, uuid4
 import logging
 
-from app.core.database import get_db, Repository, Document, Conversation, Message
+from app.core.config import settings
+from app.core.database import get_db, AsyncSessionLocal, Repository, Document, Conversation, Message
+from app.core.responses import ORJSONResponse
+from app.core.routing import ORJSONRoute
 from app.services.github_service import GitHubService
 from app.services.rag_service import RAGService
+from app.services.vector_service import VectorService
 from app.services.background_tasks import process_repository_task
-from app.services.documentation_generator import DocumentationGenerator
+from app.services.documentation_generator import (
+    DocumentationGenerator,
+    is_fallback_documentation,
+    is_fallback_faq,
+)
 from app.api.benchmark_routes import benchmark_router
+from app.api.dependencies import (
+    get_documentation_generator,
+    get_github_service,
+    get_rag_service,
+    get_vector_service,
+)
 
 logger = logging.getLogger(__name__)
-router = APIRouter()
+router = APIRouter(default_response_class=ORJSONResponse, route_class=ORJSONRoute)
 router.include_router(benchmark_router, prefix="/benchmark", tags=["benchmarks"])
 # Pydantic models for request/response
-from pydantic import BaseModel, HttpUrl
+from pydantic import BaseModel, ConfigDict, HttpUrl
+
+# Immutable, and unknown fields are dropped rather than validated
+MODEL_CONFIG = ConfigDict(frozen=True, extra="ignore")
 
 class RepositorySubmission(BaseModel):
+    model_config = MODEL_CONFIG
     url: HttpUrl
     name: Optional[str] = None
 
 class ChatMessage(BaseModel):
+    model_config = MODEL_CONFIG
     content: str
     conversation_id: Optional[UUID] = None
 
 class ChatResponse(BaseModel):
+    model_config = MODEL_CONFIG
     answer: str
     conversation_id: UUID
     sources: List[str]
     suggested_questions: Optional[List[str]] = None
 
 class RepositoryResponse(BaseModel):
+    model_config = MODEL_CONFIG
     id: UUID
     name: str
     full_name: str
@@ -42,24 +68,28 @@ class RepositoryResponse(BaseModel):
     processed_at: Optional[str] = None
     error_message: Optional[str] = None
 
+def _truncate(text: Optional[str], limit: int = 100) -> Optional[str]:
+    """Shorten text to limit characters, marking the cut with an ellipsis"""
+    if text is None or len(text) <= limit:
+        return text
+    return text[:limit] + "..."
+
 # Repository endpoints
-@router.post("/repositories/", response_model=Dict[str, any])
+@router.post("/repositories/")
 async def submit_repository(
     repo_data: RepositorySubmission,
-    background_tasks: BackgroundTasks,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db),
+    github_service: GitHubService = Depends(get_github_service)
 ):
     """Submit a repository for processing"""
     try:
-        github_service = GitHubService()
-        
         # Validate repository
         repo_info = await github_service.validate_repository(str(repo_data.url))
         
         # Check if repository already exists
-        existing_repo = db.query(Repository).filter(
-            Repository.full_name == repo_info['full_name']
-        ).first()
+        existing_repo = (await db.execute(
+            select(Repository).where(Repository.full_name == repo_info['full_name'])
+        )).scalars().first()
         
         if existing_repo:
             if existing_repo.status == "completed":
@@ -71,7 +101,8 @@ async def submit_repository(
                         "status": existing_repo.status
                     }
                 }
-            elif existing_repo.status == "processing":
+            elif existing_repo.status in ("pending", "processing"):
+                # Already queued or running; a second task would redo the same work
                 return {
                     "message": "Repository is currently being processed",
                     "repository": {
@@ -81,29 +112,59 @@ async def submit_repository(
                     }
                 }
         
-        # Create new repository record
-        repository = Repository(
-            name=repo_data.name or repo_info['name'],
-            full_name=repo_info['full_name'],
-            url=repo_info['url'],
-            description=repo_info.get('description'),
-            language=repo_info.get('language'),
-            stars=repo_info.get('stars', 0),
-            forks=repo_info.get('forks', 0),
-            size=repo_info.get('size', 0),
-            status="pending"
-        )
-        
-        db.add(repository)
-        db.commit()
-        db.refresh(repository)
-        
-        # Start background processing
-        background_tasks.add_task(
-            process_repository_task.delay,
-            str(repository.id),
-            str(repo_data.url)
-        )
+        if existing_repo:
+            # A failed repository is retried in place; full_name is unique, so
+            # inserting a second row for it would fail
+            repository = existing_repo
+            repository.status = "pending"
+            repository.error_message = None
+            repository.description = repo_info.get('description')
+            repository.language = repo_info.get('language')
+            repository.stars = repo_info.get('stars', 0)
+            repository.forks = repo_info.get('forks', 0)
+            repository.size = repo_info.get('size', 0)
+            # The retry re-inserts every file, so drop what the failed attempt stored
+            await db.execute(delete(Document).where(Document.repository_id == repository.id))
+        else:
+            # Create new repository record
+            repository = Repository(
+                name=repo_data.name or repo_info['name'],
+                full_name=repo_info['full_name'],
+                url=repo_info['url'],
+                description=repo_info.get('description'),
+                language=repo_info.get('language'),
+                stars=repo_info.get('stars', 0),
+                forks=repo_info.get('forks', 0),
+                size=repo_info.get('size', 0),
+                status="pending"
+            )
+            db.add(repository)
+        
+        await db.commit()
+        await db.refresh(repository)
+        
+        # Start background processing; publishing to the broker is blocking I/O,
+        # so run it in the executor instead of on the event loop
+        try:
+            await asyncio.get_running_loop().run_in_executor(
+                None,
+                process_repository_task.delay,
+                str(repository.id),
+                str(repo_data.url),
+                # Hand the worker what it needs so it can skip re-reading the row
+                {
+                    'name': repository.name,
+                    'description': repository.description,
+                    'language': repository.language
+                }
+            )
+        except Exception as e:
+            # Nothing was queued; left pending, every resubmission would be
+            # turned away as already in progress
+            repository.status = "failed"
+            repository.error_message = f"Failed to queue processing: {str(e)}"
+            await db.commit()
+            raise
         
         return {
             "message": "Repository submitted for processing",
@@ -119,45 +180,57 @@ async def submit_repository(
         logger.error(f"Repository submission error: {str(e)}")
         raise HTTPException(status_code=400, detail=str(e))
 
-@router.get("/repositories/", response_model=List[RepositoryResponse])
+@router.get("/repositories/", responses={200: {"model": List[RepositoryResponse]}})
 async def list_repositories(
     skip: int = Query(0, ge=0),
     limit: int = Query(10, ge=1, le=100),
     status: Optional[str] = Query(None),
-    db: Session = Depends(get_db)
-):
+    db: AsyncSession = Depends(get_db)
+) -> ORJSONResponse:
     """List repositories"""
-    query = db.query(Repository)
+    # Only the listed columns; the listing never needs the rest of the row
+    query = select(
+        Repository.id,
+        Repository.name,
+        Repository.full_name,
+        Repository.status,
+        Repository.processed_at,
+        Repository.error_message
+    )
     
     if status:
-        query = query.filter(Repository.status == status)
+        query = query.where(Repository.status == status)
     
-    repositories = query.offset(skip).limit(limit).all()
+    rows = (await db.execute(query.offset(skip).limit(limit))).all()
     
-    return [
-        RepositoryResponse(
-            id=repo.id,
-            name=repo.name,
-            full_name=repo.full_name,
-            status=repo.status,
-            processed_at=repo.processed_at.isoformat() if repo.processed_at else None,
-            error_message=repo.error_message
-        )
-        for repo in repositories
-    ]
+    # Rows come straight from the DB, so they are shaped as RepositoryResponse
+    # directly instead of going through a model on the way out
+    return ORJSONResponse([
+        {
+            'id': row.id,
+            'name': row.name,
+            'full_name': row.full_name,
+            'status': row.status,
+            'processed_at': row.processed_at.isoformat() if row.processed_at else None,
+            'error_message': row.error_message
+        }
+        for row in rows
+    ])
 
-@router.get("/repositories/{repo_id}")
-async def get_repository(repo_id: UUID, db: Session = Depends(get_db)):
+@router.get("/repositories/{repo_id:uuid}")
+async def get_repository(repo_id: UUID, db: AsyncSession = Depends(get_db)):
     """Get repository details"""
-    repository = db.query(Repository).filter(Repository.id == repo_id).first()
+    repository = await db.get(Repository, repo_id)
     
     if not repository:
         raise HTTPException(status_code=404, detail="Repository not found")
     
     # Get document count
-    doc_count = db.query(Document).filter(Document.repository_id == repo_id).count()
+    doc_count = await db.scalar(
+        select(func.count(Document.id)).where(Document.repository_id == repo_id)
+    )
     
-    return {
+    return ORJSONResponse({
         "id": repository.id,
         "name": repository.name,
         "full_name": repository.full_name,
@@ -172,29 +245,47 @@ async def get_repository(repo_id: UUID, db: Session = Depends(get_db)):
         "document_count": doc_count,
         "created_at": repository.created_at,
         "updated_at": repository.updated_at
-    }
+    })
 
-@router.get("/repositories/{repo_id}/files")
+@router.get("/repositories/{repo_id:uuid}/files")
 async def get_repository_files(
     repo_id: UUID,
     skip: int = Query(0, ge=0),
     limit: int = Query(20, ge=1, le=100),
     language: Optional[str] = Query(None),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Get repository files"""
-    repository = db.query(Repository).filter(Repository.id == repo_id).first()
+    repository = await db.get(Repository, repo_id)
     if not repository:
         raise HTTPException(status_code=404, detail="Repository not found")
     
-    query = db.query(Document).filter(Document.repository_id == repo_id)
+    filters = [Document.repository_id == repo_id]
     
     if language:
-        query = query.filter(Document.language == language)
+        filters.append(Document.language == language)
+    
+    # COUNT(*) OVER () returns the unpaginated total on every row of the page
+    documents = (await db.execute(
+        select(
+            Document.id,
+            Document.file_path,
+            Document.language,
+            Document.size,
+            Document.chunk_count,
+            func.count().over().label("total")
+        ).where(*filters).offset(skip).limit(limit)
+    )).all()
     
-    documents = query.offset(skip).limit(limit).all()
+    if documents:
+        total = documents[0].total
+    elif skip:
+        # Page past the end carries no rows to read the total from
+        total = await db.scalar(select(func.count(Document.id)).where(*filters))
+    else:
+        total = 0
     
-    return {
+    return ORJSONResponse({
         "files": [
             {
                 "id": doc.id,
@@ -205,135 +296,234 @@ async def get_repository_files(
             }
             for doc in documents
         ],
-        "total": query.count()
-    }
+        "total": total
+    })
 
 # Chat endpoints
-@router.post("/repositories/{repo_id}/chat")
+async def _prepare_chat(repo_id: UUID, message: ChatMessage, db: AsyncSession):
+    """Resolve the conversation for a chat message and load what the answer needs
+
+    Returns (conversation_id, conversation_history, collection_name, repository_info).
+    """
+    # Verify repository exists and is processed
+    repository = await db.get(Repository, repo_id)
+    if not repository:
+        raise HTTPException(status_code=404, detail="Repository not found")
+    
+    if repository.status != "completed":
+        raise HTTPException(
+            status_code=400, 
+            detail=f"Repository not ready for chat. Status: {repository.status}"
+        )
+    
+    # Get or create conversation
+    conversation_id = message.conversation_id
+    if not conversation_id:
+        conversation = Conversation(
+            repository_id=repo_id,
+            title=_truncate(message.content, 50)
+        )
+        db.add(conversation)
+        await db.commit()
+        await db.refresh(conversation)
+        conversation_id = conversation.id
+    else:
+        conversation = (await db.execute(
+            select(Conversation).where(
+                Conversation.id == conversation_id,
+                Conversation.repository_id == repo_id
+            )
+        )).scalars().first()
+        if not conversation:
+            raise HTTPException(status_code=404, detail="Conversation not found")
+    
+    # Get conversation history
+    messages = (await db.execute(
+        select(Message).where(
+            Message.conversation_id == conversation_id
+        ).order_by(Message.created_at)
+    )).scalars().all()
+    
+    conversation_history = [
+        {"role": msg.role, "content": msg.content}
+        for msg in messages
+    ]
+    
+    collection_name = VectorService.collection_name_for(repo_id)
+    
+    repository_info = {
+        "name": repository.name,
+        "description": repository.description,
+        "language": repository.language
+    }
+    
+    return conversation_id, conversation_history, collection_name, repository_info
+
+async def _save_exchange(db: AsyncSession, conversation_id: UUID, question: str, result: Dict):
+    """Store the user message and the assistant answer"""
+    db.add(Message(
+        conversation_id=conversation_id,
+        role="user",
+        content=question
+    ))
+    db.add(Message(
+        conversation_id=conversation_id,
+        role="assistant",
+        content=result['answer'],
+        context_used=result['context_used']
+    ))
+    await db.commit()
+
+@router.post("/repositories/{repo_id:uuid}/chat", responses={200: {"model": ChatResponse}})
 async def chat_with_repository(
     repo_id: UUID,
     message: ChatMessage,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db),
+    rag_service: RAGService = Depends(get_rag_service)
 ):
     """Chat with repository using RAG"""
     try:
-        # Verify repository exists and is processed
-        repository = db.query(Repository).filter(Repository.id == repo_id).first()
-        if not repository:
-            raise HTTPException(status_code=404, detail="Repository not found")
-        
-        if repository.status != "completed":
-            raise HTTPException(
-                status_code=400, 
-                detail=f"Repository not ready for chat. Status: {repository.status}"
-            )
-        
-        # Get or create conversation
-        conversation_id = message.conversation_id
-        if not conversation_id:
-            conversation = Conversation(
-                repository_id=repo_id,
-                title=message.content[:50] + "..." if len(message.content) > 50 else message.content
-            )
-            db.add(conversation)
-            db.commit()
-            db.refresh(conversation)
-            conversation_id = conversation.id
-        else:
-            conversation = db.query(Conversation).filter(
-                Conversation.id == conversation_id,
-                Conversation.repository_id == repo_id
-            ).first()
-            if not conversation:
-                raise HTTPException(status_code=404, detail="Conversation not found")
-        
-        # Get conversation history
-        messages = db.query(Message).filter(
-            Message.conversation_id == conversation_id
-        ).order_by(Message.created_at).all()
-        
-        conversation_history = [
-            {"role": msg.role, "content": msg.content}
-            for msg in messages
-        ]
-        
-        # Use RAG to answer question
-        rag_service = RAGService()
-        collection_name = f"repo_{str(repo_id).replace('-', '_')}"
-        
-        repository_info = {
-            "name": repository.name,
-            "description": repository.description,
-            "language": repository.language
-        }
-        
-        result = await rag_service.answer_question(
-            collection_name=collection_name,
-            question=message.content,
-            conversation_history=conversation_history,
-            repository_info=repository_info
-        )
-        
-        # Save user message
-        user_message = Message(
-            conversation_id=conversation_id,
-            role="user",
-            content=message.content
+        conversation_id, conversation_history, collection_name, repository_info = (
+            await _prepare_chat(repo_id, message, db)
         )
-        db.add(user_message)
         
-        # Save assistant response
-        assistant_message = Message(
-            conversation_id=conversation_id,
-            role="assistant",
-            content=result['answer'],
-            context_used=result['context_used']
-        )
-        db.add(assistant_message)
-        
-        db.commit()
-        
-        # Generate suggested questions for new conversations
+        # Suggested questions are only generated for new conversations; their
+        # completion runs alongside the answer rather than after it
         suggested_questions = None
         if len(conversation_history) == 0:  # First message in conversation
-            suggested_questions = await rag_service.generate_suggested_questions(
-                collection_name, repository_info
+            result, suggested_questions = await rag_service.bootstrap_chat(
+                collection_name=collection_name,
+                question=message.content,
+                conversation_history=conversation_history,
+                repository_info=repository_info
+            )
+        else:
+            result = await rag_service.answer_question(
+                collection_name=collection_name,
+                question=message.content,
+                conversation_history=conversation_history,
+                repository_info=repository_info
             )
         
-        return ChatResponse(
-            answer=result['answer'],
-            conversation_id=conversation_id,
-            sources=result['sources'],
-            suggested_questions=suggested_questions
-        )
+        await _save_exchange(db, conversation_id, message.content, result)
+        
+        # Shaped as ChatResponse
+        return ORJSONResponse({
+            'answer': result['answer'],
+            'conversation_id': conversation_id,
+            'sources': result['sources'],
+            'suggested_questions': suggested_questions
+        })
         
     except Exception as e:
         logger.error(f"Chat error: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Chat failed: {str(e)}")
 
-@router.get("/repositories/{repo_id}/conversations")
+def _sse_event(payload: Dict) -> bytes:
+    """Encode one server-sent event"""
+    return b"data: " + orjson.dumps(payload, default=str) + b"\n\n"
+
+@router.post("/repositories/{repo_id:uuid}/chat/stream")
+async def stream_chat_with_repository(
+    repo_id: UUID,
+    message: ChatMessage,
+    db: AsyncSession = Depends(get_db),
+    rag_service: RAGService = Depends(get_rag_service)
+):
+    """Chat with repository using RAG, streaming the answer as server-sent events
+
+    Emits {"type": "token", "content": ...} events while the answer is generated,
+    then a final {"type": "done", ...} event carrying the conversation id and
+    sources, or {"type": "error", ...} if generation fails mid-stream.
+    """
+    try:
+        conversation_id, conversation_history, collection_name, repository_info = (
+            await _prepare_chat(repo_id, message, db)
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Chat error: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Chat failed: {str(e)}")
+    
+    async def events():
+        try:
+            async for event in rag_service.answer_question_stream(
+                collection_name=collection_name,
+                question=message.content,
+                conversation_history=conversation_history,
+                repository_info=repository_info
+            ):
+                if event['type'] == 'done':
+                    # Saved only once the full answer is known, on a session of
+                    # its own: the request's session may already be closed while
+                    # the response is still streaming
+                    async with AsyncSessionLocal() as stream_db:
+                        await _save_exchange(stream_db, conversation_id, message.content, event)
+                    yield _sse_event({
+                        'type': 'done',
+                        'conversation_id': conversation_id,
+                        'sources': event['sources']
+                    })
+                else:
+                    yield _sse_event(event)
+        except Exception as e:
+            logger.error(f"Chat stream error: {str(e)}")
+            yield _sse_event({'type': 'error', 'detail': f"Chat failed: {str(e)}"})
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        # Keep reverse proxies from buffering the stream
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.get("/repositories/{repo_id:uuid}/conversations")
 async def get_conversations(
     repo_id: UUID,
     skip: int = Query(0, ge=0),
     limit: int = Query(10, ge=1, le=50),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Get repository conversations"""
-    repository = db.query(Repository).filter(Repository.id == repo_id).first()
+    repository = await db.get(Repository, repo_id)
     if not repository:
         raise HTTPException(status_code=404, detail="Repository not found")
     
-    conversations = db.query(Conversation).filter(
-        Conversation.repository_id == repo_id
-    ).order_by(Conversation.updated_at.desc()).offset(skip).limit(limit).all()
+    # Message counts per conversation, joined in a single query
+    message_counts = select(
+        Message.conversation_id,
+        func.count(Message.id).label("message_count")
+    ).group_by(Message.conversation_id).subquery()
+    
+    conversations = (await db.execute(
+        select(
+            Conversation,
+            func.coalesce(message_counts.c.message_count, 0)
+        ).options(raiseload("*")).outerjoin(
+            message_counts, message_counts.c.conversation_id == Conversation.id
+        ).where(
+            Conversation.repository_id == repo_id
+        ).order_by(Conversation.updated_at.desc()).offset(skip).limit(limit)
+    )).all()
+    
+    # Latest message of every conversation on the page in one shot (DISTINCT ON)
+    last_messages = {}
+    if conversations:
+        last_messages = {
+            msg.conversation_id: msg
+            for msg in (await db.execute(
+                select(Message).where(
+                    Message.conversation_id.in_([conv.id for conv, _ in conversations])
+                ).distinct(Message.conversation_id).order_by(
+                    Message.conversation_id, Message.created_at.desc()
+                )
+            )).scalars()
+        }
     
     result = []
-    for conv in conversations:
-        # Get message count and last message
-        message_count = db.query(Message).filter(Message.conversation_id == conv.id).count()
-        last_message = db.query(Message).filter(
-            Message.conversation_id == conv.id
-        ).order_by(Message.created_at.desc()).first()
+    for conv, message_count in conversations:
+        last_message = last_messages.get(conv.id)
         
         result.append({
             "id": conv.id,
@@ -341,28 +531,30 @@ async def get_conversations(
             "created_at": conv.created_at,
             "updated_at": conv.updated_at,
             "message_count": message_count,
-            "last_message": last_message.content[:100] + "..." if last_message and len(last_message.content) > 100 else last_message.content if last_message else None
+            "last_message": _truncate(last_message.content) if last_message else None
         })
     
-    return {"conversations": result}
+    return ORJSONResponse({"conversations": result})
 
-@router.get("/conversations/{conversation_id}/messages")
+@router.get("/conversations/{conversation_id:uuid}/messages")
 async def get_conversation_messages(
     conversation_id: UUID,
     skip: int = Query(0, ge=0),
     limit: int = Query(50, ge=1, le=100),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Get conversation messages"""
-    conversation = db.query(Conversation).filter(Conversation.id == conversation_id).first()
+    conversation = await db.get(Conversation, conversation_id)
     if not conversation:
         raise HTTPException(status_code=404, detail="Conversation not found")
     
-    messages = db.query(Message).filter(
-        Message.conversation_id == conversation_id
-    ).order_by(Message.created_at).offset(skip).limit(limit).all()
+    messages = (await db.execute(
+        select(Message).where(
+            Message.conversation_id == conversation_id
+        ).order_by(Message.created_at).offset(skip).limit(limit)
+    )).scalars().all()
     
-    return {
+    return ORJSONResponse({
         "messages": [
             {
                 "id": msg.id,
@@ -378,13 +570,56 @@ async def get_conversation_messages(
             "title": conversation.title,
             "repository_id": conversation.repository_id
         }
-    }
+    })
 
 # Documentation endpoints
-@router.get("/repositories/{repo_id}/documentation")
-async def get_documentation(repo_id: UUID, db: Session = Depends(get_db)):
+
+# (kind, repo_id, processed_at) -> (stored_at, payload). Documentation only
+# changes when a repository is re-ingested, which moves processed_at, so a
+# repeat visit skips the file listing, prompt building and completion lookup
+_generated_cache: OrderedDict = OrderedDict()
+GENERATED_CACHE_MAX_SIZE = 256
+
+def _cached_generated(key: tuple) -> Optional[Dict]:
+    """Return a stored documentation/FAQ payload younger than the TTL"""
+    hit = _generated_cache.get(key)
+    if hit is None:
+        return None
+    stored_at, payload = hit
+    if time.monotonic() - stored_at >= settings.GENERATED_CONTENT_CACHE_TTL:
+        _generated_cache.pop(key, None)
+        return None
+    _generated_cache.move_to_end(key)
+    return payload
+
+def _store_generated(key: tuple, payload: Dict):
+    """Remember a payload, evicting the least recently used beyond the size cap"""
+    _generated_cache[key] = (time.monotonic(), payload)
+    _generated_cache.move_to_end(key)
+    while len(_generated_cache) > GENERATED_CACHE_MAX_SIZE:
+        _generated_cache.popitem(last=False)
+
+async def _stream_document_files(db: AsyncSession, repo_id: UUID) -> List[Dict[str, any]]:
+    """Stream file descriptors for documentation generation in batches of 100 rows"""
+    # The generator only looks at paths and languages, so file content is never fetched
+    result = await db.stream(
+        select(Document.file_path, Document.language, Document.size)
+        .where(Document.repository_id == repo_id)
+        .execution_options(yield_per=100)
+    )
+    return [
+        {'path': row.file_path, 'language': row.language, 'size': row.size}
+        async for row in result
+    ]
+
+@router.get("/repositories/{repo_id:uuid}/documentation")
+async def get_documentation(
+    repo_id: UUID,
+    db: AsyncSession = Depends(get_db),
+    doc_generator: DocumentationGenerator = Depends(get_documentation_generator)
+):
     """Get generated documentation for repository"""
-    repository = db.query(Repository).filter(Repository.id == repo_id).first()
+    repository = await db.get(Repository, repo_id)
     if not repository:
         raise HTTPException(status_code=404, detail="Repository not found")
     
@@ -394,42 +629,44 @@ async def get_documentation(repo_id: UUID, db: Session = Depends(get_db)):
             detail="Documentation not available. Repository not fully processed."
         )
     
+    cache_key = ("documentation", repo_id, repository.processed_at)
+    cached = _cached_generated(cache_key)
+    if cached is not None:
+        return cached
+    
     try:
         # Get repository files for documentation generation
-        documents = db.query(Document).filter(Document.repository_id == repo_id).all()
-        
         repository_data = {
             'name': repository.name,
             'description': repository.description,
             'language': repository.language,
-            'files': [
-                {
-                    'path': doc.file_path,
-                    'content': doc.content,
-                    'language': doc.language,
-                    'size': doc.size
-                }
-                for doc in documents
-            ]
+            'files': await _stream_document_files(db, repo_id)
         }
         
-        doc_generator = DocumentationGenerator()
         documentation = await doc_generator.generate_documentation(repository_data)
         
-        return {
+        payload = {
             "repository_id": repo_id,
             "documentation": documentation,
-            "generated_at": asyncio.get_event_loop().time()
+            "generated_at": datetime.utcnow()
         }
+        # Placeholders from a failed generation are retried on the next request
+        if not is_fallback_documentation(documentation):
+            _store_generated(cache_key, payload)
+        return payload
         
     except Exception as e:
         logger.error(f"Documentation generation error: {str(e)}")
         raise HTTPException(status_code=500, detail="Failed to generate documentation")
 
-@router.get("/repositories/{repo_id}/faq")
-async def get_faq(repo_id: UUID, db: Session = Depends(get_db)):
+@router.get("/repositories/{repo_id:uuid}/faq")
+async def get_faq(
+    repo_id: UUID,
+    db: AsyncSession = Depends(get_db),
+    doc_generator: DocumentationGenerator = Depends(get_documentation_generator)
+):
     """Get generated FAQ for repository"""
-    repository = db.query(Repository).filter(Repository.id == repo_id).first()
+    repository = await db.get(Repository, repo_id)
     if not repository:
         raise HTTPException(status_code=404, detail="Repository not found")
     
@@ -439,46 +676,45 @@ async def get_faq(repo_id: UUID, db: Session = Depends(get_db)):
             detail="FAQ not available. Repository not fully processed."
         )
     
+    cache_key = ("faq", repo_id, repository.processed_at)
+    cached = _cached_generated(cache_key)
+    if cached is not None:
+        return cached
+    
     try:
-        documents = db.query(Document).filter(Document.repository_id == repo_id).all()
-        
         repository_data = {
             'name': repository.name,
             'description': repository.description,
             'language': repository.language,
-            'files': [
-                {
-                    'path': doc.file_path,
-                    'content': doc.content,
-                    'language': doc.language
-                }
-                for doc in documents
-            ]
+            'files': await _stream_document_files(db, repo_id)
         }
         
-        doc_generator = DocumentationGenerator()
         faq = await doc_generator.generate_faq(repository_data)
         
-        return {
+        payload = {
             "repository_id": repo_id,
             "faq": faq,
-            "generated_at": asyncio.get_event_loop().time()
+            "generated_at": datetime.utcnow()
         }
+        if not is_fallback_faq(faq):
+            _store_generated(cache_key, payload)
+        return payload
         
     except Exception as e:
         logger.error(f"FAQ generation error: {str(e)}")
         raise HTTPException(status_code=500, detail="Failed to generate FAQ")
 
 # Health and utility endpoints
-@router.get("/search/{repo_id}")
+@router.get("/search/{repo_id:uuid}")
 async def search_repository(
     repo_id: UUID,
     query: str = Query(..., min_length=1),
     limit: int = Query(5, ge=1, le=20),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db),
+    vector_service: VectorService = Depends(get_vector_service)
 ):
     """Search within repository content"""
-    repository = db.query(Repository).filter(Repository.id == repo_id).first()
+    repository = await db.get(Repository, repo_id)
     if not repository:
         raise HTTPException(status_code=404, detail="Repository not found")
     
@@ -489,9 +725,7 @@ async def search_repository(
         )
     
     try:
-        from app.services.vector_service import VectorService
-        vector_service = VectorService()
-        collection_name = f"repo_{str(repo_id).replace('-', '_')}"
+        collection_name = VectorService.collection_name_for(repo_id)
         
         results = await vector_service.search_similar(
             collection_name=collection_name,
@@ -503,7 +737,7 @@ async def search_repository(
             "query": query,
             "results": [
                 {
-                    "content": result['content'][:200] + "..." if len(result['content']) > 200 else result['content'],
+                    "content": _truncate(result['content'], 200),
                     "file_path": result['metadata']['file_path'],
                     "language": result['metadata'].get('language', 'unknown'),
                     "relevance_score": 1 - result['distance']
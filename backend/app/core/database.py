@@ -1,20 +1,46 @@
-from sqlalchemy import create_engine, Column, Integer, String, Text, DateTime, Boolean, JSON, ForeignKey
+from sqlalchemy import create_engine, Column, Integer, String, Text, DateTime, Boolean, ForeignKey, Index
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, Session, relationship
-from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.orm import sessionmaker, relationship, deferred
+from sqlalchemy.dialects.postgresql import JSONB, UUID
 from datetime import datetime
+import orjson
 import uuid
 
 from app.core.config import settings
 
 # Database setup
+def _json_serializer(value) -> str:
+    """Serialize JSON/JSONB column values with orjson (numpy arrays and scalars included)"""
+    return orjson.dumps(value, option=orjson.OPT_SERIALIZE_NUMPY).decode()
+
+# Sync engine for Celery workers and scripts
 engine = create_engine(
     settings.DATABASE_URL,
+    pool_size=settings.DB_POOL_SIZE,
+    max_overflow=settings.DB_MAX_OVERFLOW,
+    pool_timeout=settings.DB_POOL_TIMEOUT,
     pool_pre_ping=True,
-    pool_recycle=300,
+    pool_recycle=settings.DB_POOL_RECYCLE,
+    json_serializer=_json_serializer,
+    json_deserializer=orjson.loads,
 )
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+# Async engine (asyncpg) for the API request path
+async_engine = create_async_engine(
+    settings.DATABASE_URL.replace("postgresql://", "postgresql+asyncpg://", 1),
+    pool_size=settings.DB_POOL_SIZE,
+    max_overflow=settings.DB_MAX_OVERFLOW,
+    pool_timeout=settings.DB_POOL_TIMEOUT,
+    pool_pre_ping=True,
+    pool_recycle=settings.DB_POOL_RECYCLE,
+    json_serializer=_json_serializer,
+    json_deserializer=orjson.loads,
+)
+
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
 Base = declarative_base()
 
 # Database models
@@ -36,8 +62,13 @@ class Repository(Base):
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
+    __table_args__ = (
+        Index('ix_repo_status', 'status'),
+    )
+    
     # Relationships
-    documents = relationship("Document", back_populates="repository", cascade="all, delete-orphan")
+    # Loading every document is expensive; endpoints must opt in with selectinload()
+    documents = relationship("Document", back_populates="repository", cascade="all, delete-orphan", lazy="raise")
     conversations = relationship("Conversation", back_populates="repository", cascade="all, delete-orphan")
 
 class Document(Base):
@@ -46,11 +77,11 @@ class Document(Base):
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     repository_id = Column(UUID(as_uuid=True), ForeignKey("repositories.id"), nullable=False)
     file_path = Column(String, nullable=False)
-    content = Column(Text)
+    content = deferred(Column(Text))  # Large; load explicitly with undefer() when needed
     language = Column(String)
     size = Column(Integer)
     chunk_count = Column(Integer, default=0)
-    vector_ids = Column(JSON)  # Store vector IDs for this document
+    vector_ids = Column(JSONB)  # Store vector IDs for this document
     created_at = Column(DateTime, default=datetime.utcnow)
     
     # Relationships
@@ -65,6 +96,10 @@ class Conversation(Base):
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
+    __table_args__ = (
+        Index('ix_conv_repo_updated', 'repository_id', 'updated_at'),
+    )
+    
     # Relationships
     repository = relationship("Repository", back_populates="conversations")
     messages = relationship("Message", back_populates="conversation", cascade="all, delete-orphan")
@@ -76,16 +111,17 @@ class Message(Base):
     conversation_id = Column(UUID(as_uuid=True), ForeignKey("conversations.id"), nullable=False)
     role = Column(String, nullable=False)  # user, assistant
     content = Column(Text, nullable=False)
-    context_used = Column(JSON)  # Store retrieved context
+    context_used = Column(JSONB)  # Store retrieved context
     created_at = Column(DateTime, default=datetime.utcnow)
     
+    __table_args__ = (
+        Index('ix_msg_conv_created', 'conversation_id', 'created_at'),
+    )
+    
     # Relationships
     conversation = relationship("Conversation", back_populates="messages")
 
 # Dependency to get DB session
-def get_db() -> Session:
-    db = SessionLocal()
-    try:
+async def get_db() -> AsyncSession:
+    async with AsyncSessionLocal() as db:
         yield db
-    finally:
-        db.close()
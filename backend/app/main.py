@@ -4,7 +4,8 @@ from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from contextlib import asynccontextmanager
 import uvicorn
 from app.core.config import settings
-from app.core.database import engine, Base
+from app.core.database import async_engine, engine, Base
+from app.core.responses import ORJSONResponse
 from app.api.routes import router
 from app.services.background_tasks import setup_celery
 import logging
@@ -19,7 +20,8 @@ async def lifespan(app: FastAPI):
     logger.info("Starting Repository-to-Chat service...")
     
     # Create database tables
-    Base.metadata.create_all(bind=engine)
+    async with async_engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
     
     # Initialize services
     setup_celery()
@@ -28,11 +30,14 @@ async def lifespan(app: FastAPI):
     
     # Shutdown
     logger.info("Shutting down Repository-to-Chat service...")
+    await async_engine.dispose()
+    engine.dispose()
 
 app = FastAPI(
     title="Repository-to-Chat API",
     description="Transform GitHub repositories into intelligent chat interfaces",
     version="1.0.0",
+    default_response_class=ORJSONResponse,
     lifespan=lifespan
 )
 
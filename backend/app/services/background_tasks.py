@@ -2,20 +2,26 @@ import asyncio
 import tempfile
 import shutil
 import os
+import time
+from contextlib import AsyncExitStack, closing
+from datetime import datetime
 from celery import Celery
-from sqlalchemy.orm import Session
-from typing import Dict, any
+from celery.signals import worker_process_init, worker_process_shutdown
+from sqlalchemy import delete, insert, select, update
+from typing import Any, Callable, Dict, List, Optional
 import logging
 
 from app.core.config import settings
-from app.core.database import SessionLocal
-from app.core.database import Repository, Document
-from app.services.github_service import GitHubService
-from app.services.vector_service import VectorService
-from app.services.documentation_generator import DocumentationGenerator
+from app.core.database import SessionLocal, engine, Repository, Document
+from app.services.file_reader import load_content
 
 logger = logging.getLogger(__name__)
 
+# Seconds the Redis broker waits for an ack before redelivering a message. With
+# acks_late that is measured from when a task starts, so it must outlast the
+# longest ingest or a second worker starts it again alongside the first
+BROKER_VISIBILITY_TIMEOUT = 12 * 3600
+
 # Initialize Celery
 celery_app = Celery(
     'repo2chat',
@@ -29,110 +35,276 @@ celery_app.conf.update(
     result_serializer='json',
     timezone='UTC',
     enable_utc=True,
+    # Keep broker and result-backend connections pooled and alive between publishes
+    broker_pool_limit=50,
+    broker_transport_options={
+        'max_connections': 100,
+        'socket_keepalive': True,
+        'visibility_timeout': BROKER_VISIBILITY_TIMEOUT,
+    },
+    redis_max_connections=100,
+    redis_socket_keepalive=True,
+    result_backend_transport_options={'socket_keepalive': True},
+    # Repository tasks run for minutes; reserve one at a time per process so
+    # queued repositories fan out across idle workers instead of waiting behind
+    # a busy one that prefetched them. Concurrency stays bounded by --concurrency
+    worker_prefetch_multiplier=1,
+    task_acks_late=True,
 )
 
 def setup_celery():
     """Setup Celery configuration"""
     return celery_app
 
+# One event loop per worker process, reused by every task it runs
+_worker_loop = None
+
+def _get_worker_loop() -> asyncio.AbstractEventLoop:
+    """Return the worker process event loop, creating it on first use"""
+    global _worker_loop
+    if _worker_loop is None or _worker_loop.is_closed():
+        _worker_loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(_worker_loop)
+    return _worker_loop
+
+# Services are built once per worker process: VectorService loads the embedding
+# model and the generators hold pooled HTTP clients, neither of which should be
+# paid for on every task.
+_services: Dict[str, Any] = {}
+
+def get_services() -> Dict[str, Any]:
+    """Return the worker's shared service instances, creating them on first use"""
+    if not _services:
+        # Imported here so worker start-up and API imports of this module don't
+        # pull in torch, chromadb and the OpenAI client until a task runs
+        from app.services.github_service import GitHubService
+        from app.services.vector_service import VectorService
+        from app.services.documentation_generator import DocumentationGenerator
+        
+        _services.update(
+            github=GitHubService(),
+            vector=VectorService(),
+            doc=DocumentationGenerator()
+        )
+    return _services
+
+async def _close_services():
+    """Release connections and worker processes held by the shared services"""
+    github_service = _services.get('github')
+    if github_service is not None:
+        await github_service.aclose()
+    vector_service = _services.get('vector')
+    if vector_service is not None:
+        await vector_service.embedding_cache.redis.close()
+    doc_generator = _services.get('doc')
+    if doc_generator is not None:
+        await doc_generator.client.close()
+        await doc_generator.completion_cache.redis.close()
+    _services.clear()
+
+@worker_process_init.connect
+def _reset_db_pool(**kwargs):
+    """Drop pooled connections inherited from the parent so forked workers don't share sockets"""
+    # close=False leaves the parent's connections open for the parent to keep using
+    engine.dispose(close=False)
+
+@worker_process_shutdown.connect
+def _close_worker_loop(**kwargs):
+    """Close shared services and the worker event loop when the process exits"""
+    if _worker_loop is not None and not _worker_loop.is_closed():
+        _worker_loop.run_until_complete(_close_services())
+        _worker_loop.run_until_complete(_worker_loop.shutdown_asyncgens())
+        _worker_loop.close()
+
 @celery_app.task(bind=True)
-def process_repository_task(self, repo_id: str, repo_url: str):
+def process_repository_task(self, repo_id: str, repo_url: str, repo_meta: Optional[Dict[str, Any]] = None):
     """Celery task to process repository"""
-    asyncio.run(_process_repository_async(self, repo_id, repo_url))
+    return _get_worker_loop().run_until_complete(
+        _process_repository_async(self, repo_id, repo_url, repo_meta)
+    )
 
-async def _process_repository_async(task, repo_id: str, repo_url: str):
-    """Async function to process repository"""
+DOCUMENT_INSERT_BATCH_SIZE = 1000
+PROGRESS_MIN_INTERVAL = 1.0  # seconds between result-backend progress writes
+
+def _progress_publisher(task, min_interval: float = PROGRESS_MIN_INTERVAL) -> Callable[[str, int], None]:
+    """Return a progress callback that writes to the result backend at most once per interval"""
+    last_sent = 0.0
+
+    def publish(step: str, progress: int):
+        nonlocal last_sent
+        now = time.monotonic()
+        if progress >= 100 or now - last_sent >= min_interval:
+            task.update_state(state='PROGRESS', meta={'step': step, 'progress': progress})
+            last_sent = now
+
+    return publish
+
+def _make_clone_dir() -> str:
+    """Create a temporary clone directory under CLONE_TMP_DIR (system temp if unset)"""
+    base_dir = settings.CLONE_TMP_DIR or None
+    if base_dir:
+        os.makedirs(base_dir, exist_ok=True)
+    return tempfile.mkdtemp(dir=base_dir)
+
+async def _gather_or_cancel(*aws):
+    """asyncio.gather that cancels and awaits the others as soon as one fails
+
+    Unlike a TaskGroup the first exception propagates as itself, so it still
+    becomes the repository's error message.
+    """
+    tasks = [asyncio.ensure_future(aw) for aw in aws]
+    try:
+        return await asyncio.gather(*tasks)
+    except BaseException:
+        for pending in tasks:
+            pending.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+
+async def _to_thread_uninterrupted(func, *args):
+    """asyncio.to_thread that, when cancelled, waits for the thread to finish before raising
+
+    A cancelled to_thread returns at once while the call keeps running, which
+    would leave the session in use when the caller rolls it back.
+    """
+    future = asyncio.ensure_future(asyncio.to_thread(func, *args))
+    try:
+        return await asyncio.shield(future)
+    except asyncio.CancelledError:
+        await asyncio.wait([future])
+        raise
+
+async def _bulk_insert_documents(repo_id: str, files_data: List[Dict], vector_ids: List[str]):
+    """Insert Document rows with multi-row INSERTs in bounded batches
+
+    Uses its own session so it can run concurrently with work on the task's session.
+    """
     db = SessionLocal()
-    temp_dir = None
-    
     try:
-        # Update status to processing
-        repo = db.query(Repository).filter(Repository.id == repo_id).first()
-        if not repo:
-            raise ValueError("Repository not found")
-        
-        repo.status = "processing"
-        db.commit()
-        
-        # Initialize services
-        github_service = GitHubService()
-        vector_service = VectorService()
-        doc_generator = DocumentationGenerator()
-        
-        # Create temporary directory
-        temp_dir = tempfile.mkdtemp()
-        
-        # Clone repository
-        task.update_state(state='PROGRESS', meta={'step': 'cloning', 'progress': 20})
-        cloned_path = await github_service.clone_repository(repo_url, temp_dir)
-        
-        # Process files
-        task.update_state(state='PROGRESS', meta={'step': 'processing_files', 'progress': 40})
-        files_data = await github_service.process_repository(cloned_path)
-        
-        # Create vector collection
-        task.update_state(state='PROGRESS', meta={'step': 'creating_vectors', 'progress': 60})
-        collection_name = await vector_service.create_collection(str(repo_id))
-        
-        # Generate embeddings and store documents
-        vector_ids = await vector_service.add_documents(collection_name, files_data)
-        
-        # Store documents in database
-        for i, file_data in enumerate(files_data):
-            document = Document(
-                repository_id=repo_id,
-                file_path=file_data['path'],
-                content=file_data['content'],
-                language=file_data['language'],
-                size=file_data['size'],
-                chunk_count=1,  # Will be updated by vector service
-                vector_ids=vector_ids[i:i+1] if i < len(vector_ids) else []
-            )
-            db.add(document)
-        
-        # Generate documentation
-        task.update_state(state='PROGRESS', meta={'step': 'generating_docs', 'progress': 80})
-        repository_data = {
-            'name': repo.name,
-            'description': repo.description,
-            'language': repo.language,
-            'files': files_data
-        }
-        
-        documentation = await doc_generator.generate_documentation(repository_data)
-        faq_data = await doc_generator.generate_faq(repository_data)
-        
-        # Update repository status
-        task.update_state(state='PROGRESS', meta={'step': 'finalizing', 'progress': 95})
-        repo.status = "completed"
-        repo.processed_at = asyncio.get_event_loop().time()
-        
-        db.commit()
-        
-        task.update_state(state='SUCCESS', meta={'step': 'completed', 'progress': 100})
-        
-        return {
-            'status': 'completed',
-            'documents_processed': len(files_data),
-            'documentation': documentation,
-            'faq': faq_data
-        }
-        
-    except Exception as e:
-        logger.error(f"Repository processing failed: {str(e)}")
-        
-        # Update repository status to failed
-        if db and repo:
-            repo.status = "failed"
-            repo.error_message = str(e)
-            db.commit()
-        
-        task.update_state(state='FAILURE', meta={'error': str(e)})
+        # Contents are read from disk one batch at a time to keep memory bounded
+        for start in range(0, len(files_data), DOCUMENT_INSERT_BATCH_SIZE):
+            rows = [
+                {
+                    'repository_id': repo_id,
+                    'file_path': file_data['path'],
+                    'content': await load_content(file_data),
+                    'language': file_data['language'],
+                    'size': file_data['size'],
+                    'chunk_count': 1,  # Will be updated by vector service
+                    'vector_ids': vector_ids[i:i+1] if i < len(vector_ids) else []
+                }
+                for i, file_data in enumerate(files_data[start:start + DOCUMENT_INSERT_BATCH_SIZE], start)
+            ]
+            await _to_thread_uninterrupted(db.execute, insert(Document), rows)
+        await _to_thread_uninterrupted(db.commit)
+    except BaseException:
+        # Also on cancellation, when the task failed elsewhere
+        await asyncio.to_thread(db.rollback)
         raise
-    
     finally:
-        # Cleanup
-        if temp_dir and os.path.exists(temp_dir):
-            shutil.rmtree(temp_dir)
-        if db:
-            db.close()
+        db.close()
+
+def _set_repository_fields(db, repo_id: str, **values) -> bool:
+    """UPDATE a repository row in place without loading it first; False if it doesn't exist"""
+    result = db.execute(update(Repository).where(Repository.id == repo_id).values(**values))
+    db.commit()
+    return result.rowcount > 0
+
+async def _process_repository_async(task, repo_id: str, repo_url: str, repo_meta: Optional[Dict[str, Any]]):
+    """Async function to process repository"""
+    # Resources are released in reverse order on success, failure or cancellation
+    async with AsyncExitStack() as stack:
+        db = stack.enter_context(closing(SessionLocal()))
+        repo_found = False
+        
+        try:
+            # A message redelivered after a worker died replays the whole task;
+            # drop the rows an earlier run stored (create_collection already
+            # starts the vectors afresh) in the same commit as the status change
+            db.execute(delete(Document).where(Document.repository_id == repo_id))
+            
+            # Update status to processing
+            repo_found = _set_repository_fields(db, repo_id, status="processing")
+            if not repo_found:
+                raise ValueError("Repository not found")
+            
+            if repo_meta is None:
+                # Messages enqueued before repo_meta was passed along
+                row = db.execute(
+                    select(Repository.name, Repository.description, Repository.language)
+                    .where(Repository.id == repo_id)
+                ).one()
+                repo_meta = dict(row._mapping)
+            
+            services = get_services()
+            github_service = services['github']
+            vector_service = services['vector']
+            doc_generator = services['doc']
+            
+            progress = _progress_publisher(task)
+            progress('cloning', 20)
+            
+            # Small repositories are read straight from the GitHub API
+            files_data = await github_service.fetch_repository_files(repo_url)
+            
+            if files_data is None:
+                # Create temporary directory (point CLONE_TMP_DIR at tmpfs for RAM-speed metadata ops)
+                temp_dir = await asyncio.to_thread(_make_clone_dir)
+                # Removing a large clone tree must not stall the event loop
+                stack.push_async_callback(asyncio.to_thread, shutil.rmtree, temp_dir, ignore_errors=True)
+                
+                # Clone repository
+                cloned_path = await github_service.clone_repository(repo_url, temp_dir)
+                
+                # Process files
+                progress('processing_files', 40)
+                files_data = await github_service.process_repository(cloned_path)
+            
+            # Create vector collection
+            progress('creating_vectors', 60)
+            collection_name = await vector_service.create_collection(str(repo_id))
+            
+            # Generate embeddings and store documents
+            vector_ids = await vector_service.add_documents(collection_name, files_data)
+            
+            # Generate documentation
+            progress('generating_docs', 80)
+            repository_data = {
+                'name': repo_meta['name'],
+                'description': repo_meta['description'],
+                'language': repo_meta['language'],
+                'files': files_data
+            }
+            
+            # Docs, FAQ and the document insert are independent, so run them
+            # together; if one fails the others are stopped with it
+            documentation, faq_data, _ = await _gather_or_cancel(
+                doc_generator.generate_documentation(repository_data),
+                doc_generator.generate_faq(repository_data),
+                _bulk_insert_documents(repo_id, files_data, vector_ids)
+            )
+            
+            # Update repository status
+            progress('finalizing', 95)
+            _set_repository_fields(db, repo_id, status="completed", processed_at=datetime.utcnow())
+            
+            return {
+                'status': 'completed',
+                'documents_processed': len(files_data),
+                'documentation': documentation,
+                'faq': faq_data
+            }
+            
+        except Exception as e:
+            logger.error(f"Repository processing failed: {str(e)}")
+            
+            # Update repository status to failed
+            if repo_found:
+                db.rollback()
+                # A failed repository keeps no documents, including any the
+                # insert committed before a sibling failed
+                db.execute(delete(Document).where(Document.repository_id == repo_id))
+                _set_repository_fields(db, repo_id, status="failed", error_message=str(e))
+            
+            task.update_state(state='FAILURE', meta={'error': str(e)})
+            raise
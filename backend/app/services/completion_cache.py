@@ -0,0 +1,38 @@
+import logging
+from typing import Any, Dict, Optional
+
+import orjson
+import redis.asyncio as redis
+from blake3 import blake3
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+class CompletionCache:
+    """Chat completion cache stored in Redis, keyed on the exact request sent to the model"""
+
+    def __init__(self, namespace: str):
+        self.ttl = settings.COMPLETION_CACHE_TTL
+        self.redis = redis.from_url(settings.REDIS_URL)
+        self._key_prefix = f"llm:{namespace}:"
+
+    def _key(self, request: Dict[str, Any]) -> str:
+        """Hash model, messages and sampling parameters; identical prompts share one entry"""
+        return self._key_prefix + blake3(orjson.dumps(request, option=orjson.OPT_SORT_KEYS)).hexdigest()
+
+    async def get(self, request: Dict[str, Any]) -> Optional[str]:
+        """Return the cached completion text for request, None if missing"""
+        try:
+            value = await self.redis.get(self._key(request))
+        except Exception as e:
+            logger.warning(f"Completion cache lookup failed: {str(e)}")
+            return None
+        return value.decode('utf-8') if value else None
+
+    async def set(self, request: Dict[str, Any], content: str):
+        """Store the completion text for request"""
+        try:
+            await self.redis.set(self._key(request), content.encode('utf-8'), ex=self.ttl)
+        except Exception as e:
+            logger.warning(f"Completion cache store failed: {str(e)}")
@@ -1,141 +1,271 @@
 import re
 import os
-from pathlib import Path
-from typing import Set, List, Pattern
+import threading
+from typing import List, Pattern, Tuple
 import logging
 
+import regex
+
+from app.core.config import settings
+
+try:
+    import hyperscan
+except ImportError:  # hyperscan is optional; secret detection falls back to re
+    hyperscan = None
+
 logger = logging.getLogger(__name__)
 
+# Filter tables are constant; build them once at import rather than per instance
+IGNORED_DIRS = frozenset({
+    '.git', '.svn', '.hg', '.bzr',
+    'node_modules', '__pycache__', '.pytest_cache',
+    'venv', 'env', '.venv', '.env',
+    'dist', 'build', 'target', 'out',
+    '.idea', '.vscode', '.vs',
+    'coverage', '.coverage', '.nyc_output',
+    'logs', 'log', 'tmp', 'temp',
+    '.DS_Store', 'Thumbs.db',
+    'bower_components', 'vendor'
+})
+
+IGNORED_EXTS = frozenset({
+    # Binaries and executables
+    '.exe', '.dll', '.so', '.dylib', '.app',
+    '.bin', '.deb', '.rpm', '.msi', '.dmg',
+    
+    # Images and media
+    '.jpg', '.jpeg', '.png', '.gif', '.bmp', '.tiff', '.svg',
+    '.mp4', '.avi', '.mov', '.wmv', '.flv', '.webm',
+    '.mp3', '.wav', '.ogg', '.flac', '.aac',
+    
+    # Archives
+    '.zip', '.tar', '.gz', '.bz2', '.xz', '.7z', '.rar',
+    
+    # Documents
+    '.pdf', '.doc', '.docx', '.xls', '.xlsx', '.ppt', '.pptx',
+    
+    # Fonts
+    '.ttf', '.otf', '.woff', '.woff2', '.eot',
+    
+    # Other
+    '.ico', '.cur', '.db', '.sqlite', '.lock'
+})
+
+PROCESSABLE_EXTS = frozenset({
+    # Code files
+    '.py', '.js', '.ts', '.jsx', '.tsx', '.java', '.cpp', '.c', '.cs',
+    '.php', '.rb', '.go', '.rs', '.swift', '.kt', '.scala', '.clj',
+    '.sh', '.ps1', '.sql',
+    
+    # Web files
+    '.html', '.css', '.scss', '.less',
+    
+    # Config and data
+    '.json', '.xml', '.yml', '.yaml', '.toml', '.ini', '.cfg', '.conf',
+    
+    # Documentation
+    '.md', '.rst', '.txt',
+    
+    # Makefiles and scripts
+    'Makefile', 'Dockerfile', '.dockerfile',
+})
+
+# Extensionless files worth indexing (matched case-insensitively)
+NO_EXT_WHITELIST = frozenset({'dockerfile', 'makefile', 'rakefile', 'gemfile'})
+
+# README and LICENSE style files
+README_PREFIXES = ('readme', 'license', 'changelog', 'contributing')
+
+def _glob_nocase(text: str) -> str:
+    """Case-insensitive glob for text, e.g. '.py' -> '.[pP][yY]'"""
+    return ''.join(f"[{c.lower()}{c.upper()}]" if c.isalpha() else c for c in text)
+
+def sparse_checkout_patterns() -> List[str]:
+    """Non-cone sparse-checkout patterns selecting every file should_process_file can accept"""
+    patterns = [f"*{_glob_nocase(ext)}" for ext in sorted(PROCESSABLE_EXTS) if ext.startswith('.')]
+    patterns += [_glob_nocase(name) for name in sorted(NO_EXT_WHITELIST)]
+    patterns += [f"{_glob_nocase(prefix)}*" for prefix in README_PREFIXES]
+    return patterns
+
+# Unbounded quantifiers ({n,}, {n,m}, \s*, \s+) that are never followed by a
+# character they could also consume, so making them possessive loses no matches
+_BACKTRACKABLE_QUANTIFIER = re.compile(r'(\{\d+,\d*\}|\\s[*+])(?![+?])')
+
+def _possessive(pattern: str) -> str:
+    """Rewrite a secret pattern's repeat quantifiers as possessive to rule out catastrophic backtracking"""
+    return _BACKTRACKABLE_QUANTIFIER.sub(r'\1+', pattern)
+
+def secret_scan_window(content: str) -> str:
+    """The part of content scanned for secrets
+
+    Files up to twice SECRET_SCAN_MAX_CHARS are scanned whole; longer ones by
+    their leading and trailing SECRET_SCAN_MAX_CHARS, joined by a newline.
+    Applying it to its own result returns that result unchanged.
+    """
+    limit = settings.SECRET_SCAN_MAX_CHARS
+    if len(content) <= 2 * limit + 1:
+        return content
+    return content[:limit] + "\n" + content[-limit:]
+
+# Secret detection patterns, compiled once at import and shared by every filter
+SECRET_PATTERNS: Tuple[Pattern, ...] = (
+    # API keys
+    re.compile(r'api[_\-]?key\s*[=:]\s*["\']?([a-zA-Z0-9_\-]{20,})["\']?', re.IGNORECASE),
+    re.compile(r'secret[_\-]?key\s*[=:]\s*["\']?([a-zA-Z0-9_\-]{20,})["\']?', re.IGNORECASE),
+    re.compile(r'access[_\-]?token\s*[=:]\s*["\']?([a-zA-Z0-9_\-]{20,})["\']?', re.IGNORECASE),
+    
+    # AWS keys
+    re.compile(r'AKIA[0-9A-Z]{16}', re.IGNORECASE),
+    re.compile(r'aws[_\-]?secret[_\-]?access[_\-]?key', re.IGNORECASE),
+    
+    # GitHub tokens
+    re.compile(r'ghp_[a-zA-Z0-9]{36}'),
+    re.compile(r'github[_\-]?token', re.IGNORECASE),
+    
+    # Other common patterns
+    re.compile(r'password\s*[=:]\s*["\']([^"\']{8,})["\']', re.IGNORECASE),
+    re.compile(r'bearer\s+[a-zA-Z0-9_\-\.]{20,}', re.IGNORECASE),
+    re.compile(r'sk_[a-z]{2,20}_[a-zA-Z0-9]{20,}'),  # Stripe keys
+    
+    # Connection strings; the user ends at the first ':' (RFC 3986 userinfo) and
+    # both parts are bounded, so neither repeat can trade characters with the other
+    re.compile(r'mongodb://[^/\s:]{1,256}:[^@\s]{1,256}@', re.IGNORECASE),
+    re.compile(r'postgres://[^/\s:]{1,256}:[^@\s]{1,256}@', re.IGNORECASE),
+    re.compile(r'mysql://[^/\s:]{1,256}:[^@\s]{1,256}@', re.IGNORECASE),
+)
+
+# One alternation scans the content once instead of once per pattern;
+# scoped inline flags keep each pattern's own case sensitivity. Compiled
+# with `regex` for possessive quantifiers; with the connection-string
+# repeats bounded, hostile input cannot make the search backtrack
+# super-linearly
+_COMBINED_SECRET_RE = regex.compile('|'.join(
+    f"(?i:{_possessive(p.pattern)})" if p.flags & re.IGNORECASE else f"(?:{_possessive(p.pattern)})"
+    for p in SECRET_PATTERNS
+))
+
+# Every secret pattern contains one of these literals (case-folded), so
+# content with none of them can skip the regex pass entirely
+_KEYWORD_TRIGGERS = (
+    'api', 'secret', 'token', 'akia', 'ghp_', 'password',
+    'bearer', 'sk_', 'mongodb://', 'postgres://', 'mysql://'
+)
+
+def _compile_hyperscan():
+    """Compile the secret patterns into one Hyperscan database, or None if unavailable"""
+    if hyperscan is None:
+        return None
+    try:
+        db = hyperscan.Database()
+        db.compile(
+            expressions=[p.pattern.encode() for p in SECRET_PATTERNS],
+            ids=list(range(len(SECRET_PATTERNS))),
+            elements=len(SECRET_PATTERNS),
+            flags=[
+                hyperscan.HS_FLAG_CASELESS if p.flags & re.IGNORECASE else 0
+                for p in SECRET_PATTERNS
+            ]
+        )
+        return db
+    except Exception as e:
+        logger.warning(f"Hyperscan compile failed, using re for secret detection: {str(e)}")
+        return None
+
+_HS_DB = _compile_hyperscan()
+
 class ContentFilter:
     def __init__(self):
-        self.ignored_dirs = {
-            '.git', '.svn', '.hg', '.bzr',
-            'node_modules', '__pycache__', '.pytest_cache',
-            'venv', 'env', '.venv', '.env',
-            'dist', 'build', 'target', 'out',
-            '.idea', '.vscode', '.vs',
-            'coverage', '.coverage', '.nyc_output',
-            'logs', 'log', 'tmp', 'temp',
-            '.DS_Store', 'Thumbs.db',
-            'bower_components', 'vendor'
-        }
+        self.secret_patterns = SECRET_PATTERNS
+        self._combined_secret_re = _COMBINED_SECRET_RE
+        self._keyword_triggers = _KEYWORD_TRIGGERS
         
-        self.ignored_extensions = {
-            # Binaries and executables
-            '.exe', '.dll', '.so', '.dylib', '.app',
-            '.bin', '.deb', '.rpm', '.msi', '.dmg',
-            
-            # Images and media
-            '.jpg', '.jpeg', '.png', '.gif', '.bmp', '.tiff', '.svg',
-            '.mp4', '.avi', '.mov', '.wmv', '.flv', '.webm',
-            '.mp3', '.wav', '.ogg', '.flac', '.aac',
-            
-            # Archives
-            '.zip', '.tar', '.gz', '.bz2', '.xz', '.7z', '.rar',
-            
-            # Documents
-            '.pdf', '.doc', '.docx', '.xls', '.xlsx', '.ppt', '.pptx',
-            
-            # Fonts
-            '.ttf', '.otf', '.woff', '.woff2', '.eot',
-            
-            # Other
-            '.ico', '.cur', '.db', '.sqlite', '.lock'
-        }
+        # The database is shared; scratch space is per filter
+        self._hs_db = _HS_DB
+        self._hs_scratch = hyperscan.Scratch(_HS_DB) if _HS_DB is not None else None
+        self._hs_lock = threading.Lock()
+    
+    def _hyperscan_match(self, content: str) -> bool:
+        """Single-pass scan that stops at the first match"""
+        found = False
         
-        self.processable_extensions = {
-            # Code files
-            '.py', '.js', '.ts', '.jsx', '.tsx', '.java', '.cpp', '.c', '.cs',
-            '.php', '.rb', '.go', '.rs', '.swift', '.kt', '.scala', '.clj',
-            '.sh', '.ps1', '.sql',
-            
-            # Web files
-            '.html', '.css', '.scss', '.less',
-            
-            # Config and data
-            '.json', '.xml', '.yml', '.yaml', '.toml', '.ini', '.cfg', '.conf',
-            
-            # Documentation
-            '.md', '.rst', '.txt',
-            
-            # Makefiles and scripts
-            'Makefile', 'Dockerfile', '.dockerfile',
-        }
+        def on_match(pattern_id, start, end, flags, context):
+            nonlocal found
+            found = True
+            return True  # terminate the scan
         
-        # Secret detection patterns
-        self.secret_patterns: List[Pattern] = [
-            # API keys
-            re.compile(r'api[_\-]?key\s*[=:]\s*["\']?([a-zA-Z0-9_\-]{20,})["\']?', re.IGNORECASE),
-            re.compile(r'secret[_\-]?key\s*[=:]\s*["\']?([a-zA-Z0-9_\-]{20,})["\']?', re.IGNORECASE),
-            re.compile(r'access[_\-]?token\s*[=:]\s*["\']?([a-zA-Z0-9_\-]{20,})["\']?', re.IGNORECASE),
-            
-            # AWS keys
-            re.compile(r'AKIA[0-9A-Z]{16}', re.IGNORECASE),
-            re.compile(r'aws[_\-]?secret[_\-]?access[_\-]?key', re.IGNORECASE),
-            
-            # GitHub tokens
-            re.compile(r'ghp_[a-zA-Z0-9]{36}'),
-            re.compile(r'github[_\-]?token', re.IGNORECASE),
-            
-            # Other common patterns
-            re.compile(r'password\s*[=:]\s*["\']([^"\']{8,})["\']', re.IGNORECASE),
-            re.compile(r'bearer\s+[a-zA-Z0-9_\-\.]{20,}', re.IGNORECASE),
-            re.compile(r'sk_[a-z]{2,20}_[a-zA-Z0-9]{20,}'),  # Stripe keys
-            
-            # Connection strings
-            re.compile(r'mongodb://[^/\s]+:[^@\s]+@', re.IGNORECASE),
-            re.compile(r'postgres://[^/\s]+:[^@\s]+@', re.IGNORECASE),
-            re.compile(r'mysql://[^/\s]+:[^@\s]+@', re.IGNORECASE),
-        ]
+        # Scratch space is per-database state and must not be shared between concurrent scans
+        with self._hs_lock:
+            try:
+                self._hs_db.scan(
+                    content.encode('utf-8', 'surrogateescape'),
+                    match_event_handler=on_match,
+                    scratch=self._hs_scratch
+                )
+            except hyperscan.ScanTerminated:
+                pass
+        return found
+    
+    def may_contain_secrets(self, content: str) -> bool:
+        """Cheap substring pre-filter; False means no secret pattern can match"""
+        low = content.lower()
+        return any(keyword in low for keyword in self._keyword_triggers)
     
     def should_ignore_directory(self, dirname: str) -> bool:
         """Check if directory should be ignored"""
-        return dirname in self.ignored_dirs or dirname.startswith('.')
+        return dirname in IGNORED_DIRS or dirname.startswith('.')
     
-    def should_process_file(self, filepath: str) -> bool:
-        """Check if file should be processed"""
-        path = Path(filepath)
+    def should_process_name(self, name: str) -> bool:
+        """Check if a file name is worth indexing, without touching the filesystem"""
+        filename = name.lower()
+        stem, dot, suffix = filename.rpartition('.')
+        ext = dot + suffix if stem else ''
+        
+        # Always ignore certain extensions
+        if ext in IGNORED_EXTS:
+            return False
         
-        # Check if it's a file
-        if not path.is_file():
+        return (
+            # Process known good extensions
+            ext in PROCESSABLE_EXTS
+            # Process files with no extension that might be important
+            or (not ext and filename in NO_EXT_WHITELIST)
+            # Process README and LICENSE files
+            or filename.startswith(README_PREFIXES)
+        )
+    
+    def should_process_file(self, entry: os.DirEntry) -> bool:
+        """Check if a scandir entry should be processed"""
+        # Name checks come first: most rejected files are rejected by extension,
+        # and those never cost a stat syscall
+        if not self.should_process_name(entry.name):
             return False
         
-        # Check file size (basic check)
+        # DirEntry caches file type and stat results; the type usually comes
+        # from the directory listing itself
         try:
-            if path.stat().st_size > 10 * 1024 * 1024:  # 10MB
+            if not entry.is_file(follow_symlinks=False):
                 return False
+            
+            # Check file size (basic check)
+            return entry.stat(follow_symlinks=False).st_size <= 10 * 1024 * 1024  # 10MB
         except OSError:
             return False
-        
-        # Check extension
-        ext = path.suffix.lower()
-        filename = path.name.lower()
-        
-        # Always ignore certain extensions
-        if ext in self.ignored_extensions:
-            return False
-        
-        # Process known good extensions
-        if ext in self.processable_extensions:
-            return True
-        
-        # Process files with no extension that might be important
-        if not ext and filename in {'dockerfile', 'makefile', 'rakefile', 'gemfile'}:
-            return True
-        
-        # Process README and LICENSE files
-        if filename.startswith(('readme', 'license', 'changelog', 'contributing')):
-            return True
-        
-        return False
     
     def contains_secrets(self, content: str) -> bool:
         """Check if content contains potential secrets"""
         try:
-            for pattern in self.secret_patterns:
-                if pattern.search(content):
-                    logger.warning("Potential secret detected in content")
-                    return True
+            # Leaks sit in config and at the ends of files; the middle of long
+            # generated or minified blobs is not worth a full regex pass
+            content = secret_scan_window(content)
+            if not self.may_contain_secrets(content):
+                return False
+            if self._hs_db is not None:
+                matched = self._hyperscan_match(content)
+            else:
+                matched = self._combined_secret_re.search(content) is not None
+            if matched:
+                logger.warning("Potential secret detected in content")
+                return True
             return False
         except Exception as e:
             logger.error(f"Error checking for secrets: {str(e)}")
@@ -144,10 +274,9 @@ class ContentFilter:
     def sanitize_content(self, content: str) -> str:
         """Remove or mask potential secrets from content"""
         try:
-            sanitized = content
-            for pattern in self.secret_patterns:
-                sanitized = pattern.sub('***REDACTED***', sanitized)
-            return sanitized
+            if not self.may_contain_secrets(content):
+                return content
+            return self._combined_secret_re.sub('***REDACTED***', content)
         except Exception as e:
             logger.error(f"Error sanitizing content: {str(e)}")
             return content
@@ -1,39 +1,116 @@
-import openai
 from typing import List, Dict, Optional
-import asyncio
 import logging
+import ahocorasick
+import orjson
 from jinja2 import Template
 
-from app.core.config import settings
+from app.services.completion_cache import CompletionCache
+from app.services.openai_client import get_openai_client
 
 logger = logging.getLogger(__name__)
 
+# Path categories in match priority order; a file lands in the first category
+# any of whose tokens occurs in its lowered path, else in 'source'
+STRUCTURE_CATEGORIES = (
+    ('config', ('config', '.env', 'settings', 'package.json', 'requirements')),
+    ('tests', ('test', 'spec', '__test__')),
+    ('docs', ('readme', 'doc', 'md')),
+    ('scripts', ('script', 'bin', 'tool')),
+)
+
+def _build_category_automaton() -> ahocorasick.Automaton:
+    """Aho-Corasick automaton mapping each category token to its category's priority"""
+    automaton = ahocorasick.Automaton()
+    for priority, (_, tokens) in enumerate(STRUCTURE_CATEGORIES):
+        for token in tokens:
+            # A token listed under two categories keeps the higher-priority one
+            if token not in automaton:
+                automaton.add_word(token, priority)
+    automaton.make_automaton()
+    return automaton
+
+_CATEGORY_AUTOMATON = _build_category_automaton()
+
+# What a section or the FAQ reads when its generation failed
+SECTION_FALLBACKS = {
+    'overview': "Could not generate overview",
+    'api_documentation': "Could not generate API docs",
+    'setup_guide': "Could not generate setup guide",
+    'architecture': "Could not generate architecture docs"
+}
+DEFAULT_FAQ = (
+    {
+        "question": "How do I install and set up this project?",
+        "answer": "Please refer to the README file or setup guide for installation instructions."
+    },
+    {
+        "question": "What are the main dependencies?",
+        "answer": "Check the requirements.txt, package.json, or similar dependency files in the repository."
+    },
+    {
+        "question": "How do I contribute to this project?",
+        "answer": "Please check if there's a CONTRIBUTING.md file or contact the maintainers."
+    }
+)
+
+def is_fallback_documentation(documentation: Dict[str, str]) -> bool:
+    """True if any section of generated documentation is a failure placeholder"""
+    return any(documentation.get(key) == text for key, text in SECTION_FALLBACKS.items())
+
+def is_fallback_faq(faq: List[Dict[str, str]]) -> bool:
+    """True if generate_faq fell back to the default FAQ"""
+    return faq == list(DEFAULT_FAQ)
+
 class DocumentationGenerator:
     def __init__(self):
-        openai.api_key = settings.OPENAI_API_KEY
-        self.client = openai.AsyncOpenAI()
+        self.client = get_openai_client()
+        self.completion_cache = CompletionCache("docs")
+    
+    async def _complete_json(self, **request) -> any:
+        """Run a chat completion and parse its JSON reply, reusing the stored reply for an identical request
+
+        The prompts are built only from repository metadata and file paths, so an
+        unchanged repository reproduces the same request and costs no model call.
+        Only replies that parse are stored.
+        """
+        cached = await self.completion_cache.get(request)
+        if cached is not None:
+            return orjson.loads(cached)
+        
+        response = await self.client.chat.completions.create(**request)
+        content = response.choices[0].message.content
+        parsed = orjson.loads(content)
+        await self.completion_cache.set(request, content)
+        return parsed
         
     async def generate_documentation(self, repository_data: Dict[str, any]) -> Dict[str, str]:
         """Generate comprehensive documentation for repository"""
         try:
             # Analyze repository structure
             structure_analysis = await self._analyze_repository_structure(repository_data)
+            has_api = self._looks_like_api(repository_data.get('files', []))
             
-            # Generate different sections
-            tasks = [
-                self._generate_overview(repository_data, structure_analysis),
-                self._generate_api_docs(repository_data, structure_analysis),
-                self._generate_setup_guide(repository_data, structure_analysis),
-                self._generate_architecture_docs(repository_data, structure_analysis)
-            ]
+            # All sections come back from one request, so the repository context
+            # and system prompt are sent (and billed) once instead of four times
+            try:
+                sections = await self._generate_sections(repository_data, structure_analysis, has_api)
+            except Exception as e:
+                # Like a failed section before, this falls back per key rather than failing the task
+                logger.error(f"Documentation sections generation error: {str(e)}")
+                sections = {}
             
-            results = await asyncio.gather(*tasks, return_exceptions=True)
+            def section(key: str, fallback: str) -> str:
+                value = sections.get(key)
+                return value if isinstance(value, str) and value.strip() else fallback
             
             documentation = {
-                'overview': results[0] if not isinstance(results[0], Exception) else "Could not generate overview",
-                'api_documentation': results[1] if not isinstance(results[1], Exception) else "Could not generate API docs",
-                'setup_guide': results[2] if not isinstance(results[2], Exception) else "Could not generate setup guide",
-                'architecture': results[3] if not isinstance(results[3], Exception) else "Could not generate architecture docs"
+                'overview': section('overview', SECTION_FALLBACKS['overview']),
+                'api_documentation': (
+                    section('api_documentation', SECTION_FALLBACKS['api_documentation']) if has_api
+                    else "This repository does not appear to contain API endpoints."
+                ),
+                'setup_guide': section('setup_guide', SECTION_FALLBACKS['setup_guide']),
+                'architecture': section('architecture', SECTION_FALLBACKS['architecture'])
             }
             
             return documentation
@@ -70,7 +147,8 @@ class DocumentationGenerator:
             Return valid JSON array format.
             """
             
-            response = await self.client.chat.completions.create(
+            # Parse JSON response
+            faq_data = await self._complete_json(
                 model="gpt-3.5-turbo",
                 messages=[
                     {"role": "system", "content": "You are a technical documentation expert. Generate practical, helpful FAQ items based on code analysis."},
@@ -80,29 +158,12 @@ class DocumentationGenerator:
                 max_tokens=2000
             )
             
-            # Parse JSON response
-            import json
-            faq_data = json.loads(response.choices[0].message.content)
-            
             return faq_data
             
         except Exception as e:
             logger.error(f"FAQ generation error: {str(e)}")
             # Return default FAQ if generation fails
-            return [
-                {
-                    "question": "How do I install and set up this project?",
-                    "answer": "Please refer to the README file or setup guide for installation instructions."
-                },
-                {
-                    "question": "What are the main dependencies?",
-                    "answer": "Check the requirements.txt, package.json, or similar dependency files in the repository."
-                },
-                {
-                    "question": "How do I contribute to this project?",
-                    "answer": "Please check if there's a CONTRIBUTING.md file or contact the maintainers."
-                }
-            ]
+            return [dict(item) for item in DEFAULT_FAQ]
     
     async def _analyze_repository_structure(self, repository_data: Dict[str, any]) -> str:
         """Analyze repository structure and extract key information"""
@@ -118,18 +179,15 @@ class DocumentationGenerator:
                 'scripts': []
             }
             
+            # One automaton pass per path finds every category token at once
+            names = [name for name, _ in STRUCTURE_CATEGORIES]
             for file in files:
-                path = file['path'].lower()
-                if any(config in path for config in ['config', '.env', 'settings', 'package.json', 'requirements']):
-                    categories['config'].append(file['path'])
-                elif any(test in path for test in ['test', 'spec', '__test__']):
-                    categories['tests'].append(file['path'])
-                elif any(doc in path for doc in ['readme', 'doc', 'md']):
-                    categories['docs'].append(file['path'])
-                elif any(script in path for script in ['script', 'bin', 'tool']):
-                    categories['scripts'].append(file['path'])
-                else:
-                    categories['source'].append(file['path'])
+                priority = min(
+                    (p for _, p in _CATEGORY_AUTOMATON.iter(file['path'].lower())),
+                    default=None
+                )
+                category = names[priority] if priority is not None else 'source'
+                categories[category].append(file['path'])
             
             structure = f"""
             Repository Structure Analysis:
@@ -150,157 +208,101 @@ class DocumentationGenerator:
             logger.error(f"Structure analysis error: {str(e)}")
             return "Could not analyze repository structure"
     
-    async def _generate_overview(self, repository_data: Dict[str, any], structure: str) -> str:
-        """Generate project overview documentation"""
-        prompt = f"""
-        Generate a comprehensive project overview for this repository:
-        
-        Name: {repository_data['name']}
-        Description: {repository_data.get('description', 'No description')}
-        Language: {repository_data.get('language', 'Unknown')}
-        
-        {structure}
-        
-        Include:
-        1. Project purpose and goals
-        2. Key features and capabilities
-        3. Technology stack
-        4. Target audience
-        5. Current status and maturity level
-        
-        Format as markdown with clear sections.
-        """
-        
-        response = await self.client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[
-                {"role": "system", "content": "You are a technical writer creating project documentation."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.5,
-            max_tokens=1000
-        )
-        
-        return response.choices[0].message.content
-    
-    async def _generate_api_docs(self, repository_data: Dict[str, any], structure: str) -> str:
-        """Generate API documentation if applicable"""
-        # Check if this looks like an API project
-        files = repository_data.get('files', [])
-        api_indicators = ['api', 'route', 'endpoint', 'handler', 'controller']
-        
-        has_api = any(
+    def _looks_like_api(self, files: List[Dict[str, any]]) -> bool:
+        """Check if this looks like an API project"""
+        api_indicators = ('api', 'route', 'endpoint', 'handler', 'controller')
+        return any(
             any(indicator in file['path'].lower() for indicator in api_indicators)
             for file in files
         )
-        
-        if not has_api:
-            return "This repository does not appear to contain API endpoints."
-        
-        prompt = f"""
-        Generate API documentation for this repository:
-        
-        {structure}
-        
-        Based on the file structure, document:
-        1. Available endpoints (if detectable)
-        2. Request/response formats
-        3. Authentication requirements
-        4. Error handling
-        5. Usage examples
-        
-        Format as markdown with clear sections.
-        """
-        
-        response = await self.client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[
-                {"role": "system", "content": "You are an API documentation expert."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.3,
-            max_tokens=1500
-        )
-        
-        return response.choices[0].message.content
     
-    async def _generate_setup_guide(self, repository_data: Dict[str, any], structure: str) -> str:
-        """Generate setup and installation guide"""
+    async def _generate_sections(self, repository_data: Dict[str, any], structure: str, has_api: bool) -> Dict[str, any]:
+        """Generate every documentation section in a single JSON-mode completion"""
+        api_section = """
+        "api_documentation": API documentation. Based on the file structure, document:
+            1. Available endpoints (if detectable)
+            2. Request/response formats
+            3. Authentication requirements
+            4. Error handling
+            5. Usage examples
+        """ if has_api else ""
+        
         prompt = f"""
-        Generate a setup and installation guide for:
+        Generate documentation for this repository:
         
         Name: {repository_data['name']}
+        Description: {repository_data.get('description', 'No description')}
         Language: {repository_data.get('language', 'Unknown')}
         
         {structure}
         
-        Include:
-        1. Prerequisites and dependencies
-        2. Installation steps
-        3. Configuration requirements
-        4. Environment setup
-        5. Verification steps
-        6. Common issues and troubleshooting
+        Return a JSON object whose values are markdown strings with clear sections, using these keys:
         
-        Format as markdown with step-by-step instructions.
-        """
+        "overview": A comprehensive project overview. Include:
+            1. Project purpose and goals
+            2. Key features and capabilities
+            3. Technology stack
+            4. Target audience
+            5. Current status and maturity level
+        {api_section}
+        "setup_guide": A setup and installation guide with step-by-step instructions. Include:
+            1. Prerequisites and dependencies
+            2. Installation steps
+            3. Configuration requirements
+            4. Environment setup
+            5. Verification steps
+            6. Common issues and troubleshooting
         
-        response = await self.client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[
-                {"role": "system", "content": "You are a technical writer creating setup guides."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.3,
-            max_tokens=1200
-        )
-        
-        return response.choices[0].message.content
-    
-    async def _generate_architecture_docs(self, repository_data: Dict[str, any], structure: str) -> str:
-        """Generate architecture documentation"""
-        prompt = f"""
-        Generate architecture documentation for:
-        
-        {repository_data['name']}
-        Language: {repository_data.get('language', 'Unknown')}
-        
-        {structure}
-        
-        Document:
-        1. High-level architecture
-        2. Component relationships
-        3. Data flow
-        4. Key design decisions
-        5. Scalability considerations
-        
-        Format as markdown with clear sections.
+        "architecture": Architecture documentation. Document:
+            1. High-level architecture
+            2. Component relationships
+            3. Data flow
+            4. Key design decisions
+            5. Scalability considerations
         """
         
-        response = await self.client.chat.completions.create(
+        sections = await self._complete_json(
             model="gpt-3.5-turbo",
             messages=[
-                {"role": "system", "content": "You are a software architect documenting system design."},
+                {"role": "system", "content": "You are a technical writer and software architect creating project documentation. Respond with a JSON object."},
                 {"role": "user", "content": prompt}
             ],
+            response_format={"type": "json_object"},
             temperature=0.4,
-            max_tokens=1500
+            max_tokens=4000
         )
-        
-        return response.choices[0].message.content
+        return sections if isinstance(sections, dict) else {}
     
     async def _analyze_code_patterns(self, repository_data: Dict[str, any]) -> str:
         """Analyze code patterns for FAQ generation"""
         files = repository_data.get('files', [])
         
-        # Look for common patterns
+        # Look for common patterns in a single pass, stopping once all are found
+        has_tests = has_config = has_database = has_api = has_frontend = has_docker = False
+        for f in files:
+            path = f['path'].lower()
+            if not has_tests and 'test' in path:
+                has_tests = True
+            if not has_config and any(c in path for c in ('config', '.env', 'settings')):
+                has_config = True
+            if not has_database and any(db in path for db in ('model', 'schema', 'migration')):
+                has_database = True
+            if not has_api and any(api in path for api in ('api', 'route', 'endpoint')):
+                has_api = True
+            if not has_frontend and f['language'] in ('javascript', 'typescript', 'html', 'css'):
+                has_frontend = True
+            if not has_docker and 'docker' in path:
+                has_docker = True
+            if has_tests and has_config and has_database and has_api and has_frontend and has_docker:
+                break
+        
         patterns = {
-            'has_tests': any('test' in f['path'].lower() for f in files),
-            'has_config': any(any(c in f['path'].lower() for c in ['config', '.env', 'settings']) for f in files),
-            'has_database': any(any(db in f['path'].lower() for db in ['model', 'schema', 'migration']) for f in files),
-            'has_api': any(any(api in f['path'].lower() for api in ['api', 'route', 'endpoint']) for f in files),
-            'has_frontend': any(f['language'] in ['javascript', 'typescript', 'html', 'css'] for f in files),
-            'has_docker': any('docker' in f['path'].lower() for f in files)
+            'has_tests': has_tests,
+            'has_config': has_config,
+            'has_database': has_database,
+            'has_api': has_api,
+            'has_frontend': has_frontend,
+            'has_docker': has_docker
         }
         
         return f"Code patterns detected: {patterns}"
@@ -0,0 +1,83 @@
+import asyncio
+from concurrent.futures import Executor
+from typing import Callable, List, Optional, Tuple
+
+class EmbeddingBatcher:
+    """Coalesce concurrent embedding requests into windowed model batches"""
+
+    def __init__(
+        self,
+        encode: Callable[[List[str]], List[List[float]]],
+        executor: Optional[Executor] = None,  # None uses the loop's default thread pool
+        max_batch_size: int = 128,
+        max_wait_ms: int = 50
+    ):
+        self._encode = encode
+        self._executor = executor
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+
+    def _ensure_worker(self):
+        """Start the draining coroutine on the running loop"""
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop or self._worker is None or self._worker.done():
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._worker = loop.create_task(self._run())
+
+    async def submit(self, texts: List[str]) -> List[List[float]]:
+        """Embed texts, sharing model calls with any other pending requests"""
+        if not texts:
+            return []
+        self._ensure_worker()
+
+        futures = []
+        for text in texts:
+            future = self._loop.create_future()
+            self._queue.put_nowait((text, future))
+            futures.append(future)
+
+        return list(await asyncio.gather(*futures))
+
+    async def _next_batch(self) -> List[Tuple[str, asyncio.Future]]:
+        """Wait for one request, then collect more until the batch is full or the window closes"""
+        batch = [await self._queue.get()]
+        deadline = self._loop.time() + self.max_wait
+
+        while len(batch) < self.max_batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+                continue
+            except asyncio.QueueEmpty:
+                pass
+
+            timeout = deadline - self._loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+
+        return batch
+
+    async def _run(self):
+        while True:
+            batch = await self._next_batch()
+            texts = [text for text, _ in batch]
+
+            try:
+                embeddings = await self._loop.run_in_executor(self._executor, self._encode, texts)
+            except Exception as e:
+                # Fail every caller waiting on this batch
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            for (_, future), embedding in zip(batch, embeddings):
+                if not future.done():
+                    future.set_result(embedding)
@@ -0,0 +1,71 @@
+import logging
+from typing import List, Optional
+
+import numpy as np
+import redis.asyncio as redis
+from blake3 import blake3
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Entries are int8 scaled per vector to the largest component, stored after that
+# float32 scale: 388 bytes for a 384-dim embedding instead of 1536 as float32.
+# The round trip costs well under 1e-3 of cosine similarity on unit-normalized embeddings
+CACHE_DTYPE = np.int8
+_SCALE_DTYPE = np.dtype(np.float32)
+_QUANT_MAX = 127
+
+def quantize(embeddings: np.ndarray) -> List[bytes]:
+    """Encode each row as its float32 scale followed by its int8 components"""
+    scales = np.abs(embeddings).max(axis=1, keepdims=True).astype(_SCALE_DTYPE)
+    scales[scales == 0] = 1
+    quantized = np.clip(np.rint(embeddings / scales * _QUANT_MAX), -_QUANT_MAX, _QUANT_MAX).astype(CACHE_DTYPE)
+    return [scale.tobytes() + row.tobytes() for scale, row in zip(scales, quantized)]
+
+def dequantize(value: bytes) -> np.ndarray:
+    """Inverse of quantize for a single entry"""
+    scale = np.frombuffer(value, dtype=_SCALE_DTYPE, count=1)[0]
+    row = np.frombuffer(value, dtype=CACHE_DTYPE, offset=_SCALE_DTYPE.itemsize)
+    return row.astype(np.float32) * (scale / _QUANT_MAX)
+
+class EmbeddingCache:
+    """Content-addressed embedding cache stored in Redis"""
+
+    def __init__(self, model_name: str):
+        self.model_name = model_name
+        self.ttl = settings.EMBEDDING_CACHE_TTL
+        self.redis = redis.from_url(settings.REDIS_URL)
+        # The dtype and normalization are part of the key so entries from older
+        # deploys are never misread
+        self._key_prefix = f"emb:{model_name}:{np.dtype(CACHE_DTYPE).name}:norm:"
+        self._hash_prefix = model_name.encode() + b"\0"
+
+    def _key(self, text: str) -> str:
+        """Key on the exact bytes sent to the embedder, salted with the model name"""
+        return self._key_prefix + blake3(self._hash_prefix + text.encode('utf-8')).hexdigest()
+
+    async def get_many(self, texts: List[str]) -> List[Optional[List[float]]]:
+        """Return cached embeddings for texts, None where missing"""
+        if not texts:
+            return []
+        try:
+            values = await self.redis.mget([self._key(text) for text in texts])
+        except Exception as e:
+            logger.warning(f"Embedding cache lookup failed: {str(e)}")
+            return [None] * len(texts)
+
+        return [dequantize(value).tolist() if value else None for value in values]
+
+    async def set_many(self, texts: List[str], embeddings: List[List[float]]):
+        """Store embeddings as scaled int8 bytes"""
+        if not texts:
+            return
+        try:
+            values = quantize(np.asarray(embeddings, dtype=np.float32))
+            async with self.redis.pipeline(transaction=False) as pipe:
+                for text, value in zip(texts, values):
+                    pipe.set(self._key(text), value, ex=self.ttl)
+                await pipe.execute()
+        except Exception as e:
+            logger.warning(f"Embedding cache store failed: {str(e)}")
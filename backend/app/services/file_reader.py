@@ -0,0 +1,47 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+# One shared pool for blocking file reads; a plain open().read() per task is
+# far cheaper than aiofiles' per-operation thread dispatch for small files
+_io_pool = ThreadPoolExecutor(max_workers=32, thread_name_prefix="file-reader")
+
+# Same heuristic as git/grep: a NUL in the leading block means binary
+BINARY_SNIFF_BYTES = 8192
+
+def _read_sync(file_path: str) -> Optional[str]:
+    """Blocking read with encoding detection; binary files yield None"""
+    try:
+        # Read the bytes once and decode in memory, rather than reopening
+        # the file for the fallback encoding
+        with open(file_path, 'rb') as f:
+            data = f.read()
+    except Exception as e:
+        logger.warning(f"Error reading file {file_path}: {str(e)}")
+        return None
+    return decode_file_bytes(data)
+
+def decode_file_bytes(data: bytes) -> Optional[str]:
+    """Decode raw file bytes with encoding detection; binary content yields None"""
+    if b'\x00' in data[:BINARY_SNIFF_BYTES]:
+        return None
+    
+    try:
+        # Try UTF-8 first
+        return data.decode('utf-8')
+    except UnicodeDecodeError:
+        # latin-1 maps every byte, so the fallback cannot fail
+        return data.decode('latin-1')
+
+async def read_file_content(file_path: str) -> Optional[str]:
+    """Read file content with encoding detection"""
+    return await asyncio.get_running_loop().run_in_executor(_io_pool, _read_sync, file_path)
+
+async def load_content(file_data: Dict[str, any]) -> str:
+    """Return a processed file's content, reading it from disk if it was not kept in memory"""
+    if 'content' in file_data:
+        return file_data['content']
+    return await read_file_content(file_data['content_path']) or ''
@@ -1,23 +1,192 @@
 import git
+import httpx
 import os
+import re
 import shutil
 import tempfile
 import asyncio
-from typing import List, Dict, Optional, Tuple
-from github import Github, GithubException
-import aiofiles
-from pathlib import Path
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import lru_cache
+from typing import AsyncIterator, Callable, List, Dict, Optional, Tuple
+from github import Auth, Github, GithubException, GithubRetry
 import logging
 
 from app.core.config import settings
-from app.services.content_filter import ContentFilter
+from app.services.content_filter import ContentFilter, secret_scan_window, sparse_checkout_patterns
+from app.services.file_reader import decode_file_bytes, read_file_content
 
 logger = logging.getLogger(__name__)
 
+# Files per batch yielded by stream_repository
+STREAM_BATCH_SIZE = 32
+
+# Worker threads listing directories in parallel during the scan
+SCAN_THREADS = 8
+
+# Reader coroutines screening files while the scan is still running
+FILE_READ_CONCURRENCY = 16
+
+# Repositories up to this many indexable files, and this many bytes of them, are
+# fetched through the Trees/Blobs API instead of being cloned
+TREE_API_MAX_FILES = 500
+TREE_API_MAX_BYTES = 20 * 1024 * 1024
+
+# Concurrent blob downloads on the API path
+BLOB_FETCH_CONCURRENCY = 32
+
+# Seconds a validated repository's metadata is reused before asking the API again
+REPO_INFO_TTL = 300
+
+# https/SSH GitHub URLs or a bare owner/repo; a trailing .git and any deeper
+# path (e.g. /tree/main) are ignored
+_GITHUB_URL_RE = re.compile(
+    r'^(?:https?://(?:www\.)?github\.com/|git@github\.com:|/)?([^/:\s]+)/([^/\s]+?)(?:\.git)?(?:/.*)?$'
+)
+
+# Extension -> language table, built once at import rather than per file
+LANGUAGE_MAP = {
+    '.py': 'python',
+    '.js': 'javascript',
+    '.ts': 'typescript',
+    '.jsx': 'javascript',
+    '.tsx': 'typescript',
+    '.java': 'java',
+    '.cpp': 'cpp',
+    '.c': 'c',
+    '.cs': 'csharp',
+    '.php': 'php',
+    '.rb': 'ruby',
+    '.go': 'go',
+    '.rs': 'rust',
+    '.swift': 'swift',
+    '.kt': 'kotlin',
+    '.scala': 'scala',
+    '.clj': 'clojure',
+    '.sh': 'bash',
+    '.ps1': 'powershell',
+    '.sql': 'sql',
+    '.html': 'html',
+    '.css': 'css',
+    '.scss': 'scss',
+    '.less': 'less',
+    '.md': 'markdown',
+    '.yml': 'yaml',
+    '.yaml': 'yaml',
+    '.json': 'json',
+    '.xml': 'xml',
+    '.toml': 'toml',
+    '.ini': 'ini',
+    '.cfg': 'ini',
+    '.conf': 'ini'
+}
+
+@lru_cache(maxsize=None)
+def _ext_to_lang(ext: str) -> str:
+    """Language for a lowered extension; the set of extensions seen is small, so cache them all"""
+    return LANGUAGE_MAP.get(ext, 'text')
+
+# Per-process filter for secret-scan workers, built once by the pool initializer
+_worker_filter: Optional[ContentFilter] = None
+
+def _init_secret_worker():
+    global _worker_filter
+    _worker_filter = ContentFilter()
+
+def _contains_secrets_worker(content: str) -> bool:
+    return _worker_filter.contains_secrets(content)
+
+@lru_cache(maxsize=1)
+def _github_client() -> Optional[Github]:
+    """One PyGithub client per process, so its pooled HTTPS connections are reused"""
+    if not settings.GITHUB_TOKEN:
+        return None
+    return Github(
+        auth=Auth.Token(settings.GITHUB_TOKEN),
+        per_page=100,
+        retry=GithubRetry(total=3, backoff_factor=0.5)
+    )
+
+@lru_cache(maxsize=256)
+def _fetch_repo_info(repo_path: str, ttl_bucket: int) -> Dict[str, any]:
+    """Repository metadata from the API, memoized per owner/repo for one TTL window
+
+    ttl_bucket only varies the cache key; errors are raised and never cached.
+    """
+    repo = _github_client().get_repo(repo_path)
+    return {
+        "name": repo.name,
+        "full_name": repo.full_name,
+        "url": repo.clone_url,
+        "description": repo.description,
+        "language": repo.language,
+        "stars": repo.stargazers_count,
+        "forks": repo.forks_count,
+        "size": repo.size,
+        "default_branch": repo.default_branch
+    }
+
 class GitHubService:
     def __init__(self):
-        self.github = Github(settings.GITHUB_TOKEN) if settings.GITHUB_TOKEN else None
+        self.github = _github_client()
         self.content_filter = ContentFilter()
+        # Created on first use so API processes that only validate URLs never fork
+        self._secret_pool: Optional[ProcessPoolExecutor] = None
+        self._secret_pool_disabled = False
+        # REST API client for the Trees/Blobs path, kept open so its TLS
+        # connections are reused from one repository to the next
+        self._api_client: Optional[httpx.AsyncClient] = None
+    
+    def close(self):
+        """Shut down the secret-scan worker processes"""
+        if self._secret_pool is not None:
+            self._secret_pool.shutdown(wait=False, cancel_futures=True)
+            self._secret_pool = None
+    
+    async def aclose(self):
+        """Close the API connection pool and the secret-scan worker processes"""
+        if self._api_client is not None:
+            await self._api_client.aclose()
+            self._api_client = None
+        self.close()
+    
+    def _github_api(self) -> httpx.AsyncClient:
+        """The shared REST API client, created on first use"""
+        if self._api_client is None or self._api_client.is_closed:
+            self._api_client = httpx.AsyncClient(
+                base_url="https://api.github.com",
+                headers={
+                    "Authorization": f"Bearer {settings.GITHUB_TOKEN}",
+                    "Accept": "application/vnd.github+json"
+                },
+                timeout=30
+            )
+        return self._api_client
+    
+    async def _contains_secrets(self, content: str) -> bool:
+        """Secret check whose regex pass runs in a worker process, off the GIL and the event loop"""
+        sample = secret_scan_window(content)
+        # The keyword gate is cheap; only files that pass it pay for the IPC round trip
+        if not self.content_filter.may_contain_secrets(sample):
+            return False
+        
+        if not self._secret_pool_disabled:
+            if self._secret_pool is None:
+                self._secret_pool = ProcessPoolExecutor(
+                    max_workers=os.cpu_count(), initializer=_init_secret_worker
+                )
+            try:
+                return await asyncio.get_running_loop().run_in_executor(
+                    self._secret_pool, _contains_secrets_worker, sample
+                )
+            except (AssertionError, BrokenProcessPool, OSError) as e:
+                # e.g. daemonic worker processes may not have children
+                logger.warning(f"Secret-scan process pool unavailable, scanning in-process: {str(e)}")
+                self._secret_pool_disabled = True
+                self.close()
+        
+        return self.content_filter.contains_secrets(sample)
         
     async def validate_repository(self, repo_url: str) -> Dict[str, any]:
         """Validate and extract repository information"""
@@ -29,18 +198,12 @@ class GitHubService:
             
             # Get repository metadata
             if self.github:
-                repo = self.github.get_repo(repo_path)
-                return {
-                    "name": repo.name,
-                    "full_name": repo.full_name,
-                    "url": repo.clone_url,
-                    "description": repo.description,
-                    "language": repo.language,
-                    "stars": repo.stargazers_count,
-                    "forks": repo.forks_count,
-                    "size": repo.size,
-                    "default_branch": repo.default_branch
-                }
+                # PyGithub is blocking, keep the API round trip off the event loop
+                repo_info = await asyncio.get_running_loop().run_in_executor(
+                    None, _fetch_repo_info, repo_path, int(time.monotonic() // REPO_INFO_TTL)
+                )
+                # Hand out a copy so callers never mutate the memoized entry
+                return dict(repo_info)
             else:
                 # Basic validation without API
                 return {
@@ -68,13 +231,8 @@ class GitHubService:
             logger.info(f"Cloning repository: {repo_url}")
             
             # Use asyncio to run git clone in thread pool
-            await asyncio.get_event_loop().run_in_executor(
-                None, 
-                lambda: git.Repo.clone_from(
-                    repo_url, 
-                    temp_dir,
-                    depth=1  # Shallow clone for efficiency
-                )
+            await asyncio.get_running_loop().run_in_executor(
+                None, self._clone_sparse, repo_url, temp_dir
             )
             
             logger.info(f"Repository cloned to: {temp_dir}")
@@ -87,139 +245,288 @@ class GitHubService:
             logger.error(f"Clone error: {str(e)}")
             raise ValueError(f"Repository clone failed: {str(e)}")
     
+    async def fetch_repository_files(self, repo_url: str) -> Optional[List[Dict[str, any]]]:
+        """Fetch and screen a small repository's files through the GitHub API, without cloning
+
+        Returns None when a clone is needed instead: no token, a truncated tree,
+        a repository over the TREE_API_* limits, or any API error.
+        """
+        repo_path = self._parse_github_url(repo_url)
+        if self.github is None or not repo_path:
+            return None
+        
+        try:
+            client = self._github_api()
+            # The whole file list, sizes included, in one request
+            response = await client.get(f"/repos/{repo_path}/git/trees/HEAD", params={"recursive": "1"})
+            response.raise_for_status()
+            tree = response.json()
+            if tree.get('truncated'):
+                return None
+            
+            candidates = self._select_tree_entries(tree['tree'])
+            if candidates is None:
+                return None
+            
+            semaphore = asyncio.Semaphore(BLOB_FETCH_CONCURRENCY)
+            
+            async def fetch(path: str, sha: str, size: int) -> Optional[Dict[str, any]]:
+                async with semaphore:
+                    blob = await client.get(
+                        f"/repos/{repo_path}/git/blobs/{sha}",
+                        headers={"Accept": "application/vnd.github.raw"}
+                    )
+                blob.raise_for_status()
+                content = decode_file_bytes(blob.content)
+                if not content or await self._contains_secrets(content):
+                    return None
+                # Kept in memory; load_content returns it without touching disk
+                return {
+                    "path": path,
+                    "content": content,
+                    "language": self._detect_language(path),
+                    "size": size
+                }
+            
+            results = await asyncio.gather(*(fetch(*c) for c in candidates))
+        
+        except (httpx.HTTPError, KeyError, ValueError) as e:
+            logger.warning(f"GitHub API fetch failed for {repo_path}, falling back to clone: {str(e)}")
+            return None
+        
+        files_data = [file_data for file_data in results if file_data is not None]
+        logger.info(f"Fetched {len(files_data)} files for {repo_path} via the GitHub API")
+        return files_data
+    
+    def _select_tree_entries(self, entries: List[Dict[str, any]]) -> Optional[List[Tuple[str, str, int]]]:
+        """Apply the clone path's filters to a recursive tree listing
+
+        Returns (path, blob_sha, size) for indexable files, or None if the
+        repository is too large for the API path.
+        """
+        candidates = []
+        total_size = 0
+        # Directory path -> ignored; each directory is judged once, so every
+        # file under node_modules costs one dict lookup rather than a path scan
+        ignored_dirs = {'': False}
+        for entry in entries:
+            # Regular files only; symlinks (mode 120000) and submodules are skipped
+            if entry['type'] != 'blob' or entry['mode'] == '120000':
+                continue
+            
+            dir_path, _, name = entry['path'].rpartition('/')
+            if self._is_ignored_dir(dir_path, ignored_dirs):
+                continue
+            if not self.content_filter.should_process_name(name):
+                continue
+            
+            # Sizes come with the listing, so oversized files are never downloaded
+            size = entry.get('size', 0)
+            if size > settings.MAX_FILE_SIZE:
+                logger.warning(f"Skipping large file: {entry['path']} ({size} bytes)")
+                continue
+            
+            total_size += size
+            if len(candidates) >= TREE_API_MAX_FILES or total_size > TREE_API_MAX_BYTES:
+                return None
+            candidates.append((entry['path'], entry['sha'], size))
+        
+        return candidates
+    
+    def _is_ignored_dir(self, dir_path: str, ignored_dirs: Dict[str, bool]) -> bool:
+        """Whether dir_path or any directory above it is ignored, memoized in ignored_dirs"""
+        ignored = ignored_dirs.get(dir_path)
+        if ignored is None:
+            parent, _, dirname = dir_path.rpartition('/')
+            ignored = (
+                self._is_ignored_dir(parent, ignored_dirs)
+                or self.content_filter.should_ignore_directory(dirname)
+            )
+            ignored_dirs[dir_path] = ignored
+        return ignored
+    
+    def _clone_sparse(self, repo_url: str, temp_dir: str):
+        """Blobless shallow clone that only materializes files the filter can index
+
+        --filter=blob:none alone saves nothing for a full checkout, since checkout
+        fetches every blob anyway; paired with a sparse checkout, binaries, media
+        and other unprocessable files are never downloaded.
+        """
+        repo = git.Repo.clone_from(
+            repo_url,
+            temp_dir,
+            depth=1,  # Shallow clone for efficiency
+            single_branch=True,
+            multi_options=['--filter=blob:none', '--no-tags', '--sparse'],
+            # Only text at HEAD is indexed; never download LFS objects
+            env={**os.environ, 'GIT_LFS_SKIP_SMUDGE': '1'}
+        )
+        try:
+            # Patterns match at any depth and fetch the selected blobs in one batch
+            repo.git.sparse_checkout('set', '--no-cone', *sparse_checkout_patterns())
+        except git.exc.GitCommandError as e:
+            logger.warning(f"Sparse checkout failed, checking out full tree: {str(e)}")
+            repo.git.sparse_checkout('disable')
+    
     async def process_repository(self, repo_path: str) -> List[Dict[str, any]]:
         """Process repository files and extract content"""
+        files_data = []
+        async for batch in self.stream_repository(repo_path):
+            files_data.extend(batch)
+        return files_data
+    
+    async def stream_repository(
+        self, repo_path: str, batch_size: int = STREAM_BATCH_SIZE
+    ) -> AsyncIterator[List[Dict[str, any]]]:
+        """Process repository files, yielding them in batches as they are screened
+
+        Lets a consumer (e.g. embedding) start on the first files while the rest
+        are still being read.
+        """
+        loop = asyncio.get_running_loop()
+        paths: asyncio.Queue = asyncio.Queue()
+        screened: asyncio.Queue = asyncio.Queue()
+        done_marker = object()
+        
+        def emit(candidate: Optional[Tuple[str, str, int]]):
+            # Called from the scan thread
+            loop.call_soon_threadsafe(paths.put_nowait, candidate)
+        
+        async def scan() -> int:
+            try:
+                # The directory walk and stat calls are blocking; run them off the loop
+                return await asyncio.to_thread(self._scan_repository, repo_path, emit)
+            finally:
+                # Queued after every emitted path, so readers drain them all first
+                for _ in range(FILE_READ_CONCURRENCY):
+                    paths.put_nowait(None)
+        
+        async def reader():
+            while (candidate := await paths.get()) is not None:
+                file_data = await self._screen_file(*candidate)
+                if file_data is not None:
+                    screened.put_nowait(file_data)
+            screened.put_nowait(done_marker)
+        
+        # Walking, reading and screening overlap: readers start on the first
+        # paths while the scan is still listing directories
+        scan_task = asyncio.create_task(scan())
+        readers = [asyncio.create_task(reader()) for _ in range(FILE_READ_CONCURRENCY)]
         try:
             logger.info(f"Processing repository at: {repo_path}")
             
-            files_data = []
-            total_size = 0
-            
-            for root, dirs, files in os.walk(repo_path):
-                # Filter directories
-                dirs[:] = [d for d in dirs if not self.content_filter.should_ignore_directory(d)]
+            files_count = 0
+            batch = []
+            finished = 0
+            while finished < len(readers):
+                file_data = await screened.get()
+                if file_data is done_marker:
+                    finished += 1
+                    continue
                 
-                for file in files:
-                    file_path = os.path.join(root, file)
-                    relative_path = os.path.relpath(file_path, repo_path)
-                    
-                    # Check if file should be processed
-                    if not self.content_filter.should_process_file(file_path):
-                        continue
-                    
-                    # Check file size
-                    try:
-                        file_size = os.path.getsize(file_path)
-                        if file_size > settings.MAX_FILE_SIZE:
-                            logger.warning(f"Skipping large file: {relative_path} ({file_size} bytes)")
-                            continue
-                        
-                        total_size += file_size
-                        if total_size > settings.MAX_REPO_SIZE:
-                            logger.warning("Repository size limit exceeded")
-                            break
-                        
-                        # Read file content
-                        content = await self._read_file_content(file_path)
-                        if content and not self.content_filter.contains_secrets(content):
-                            files_data.append({
-                                "path": relative_path,
-                                "content": content,
-                                "language": self._detect_language(file_path),
-                                "size": file_size
-                            })
-                    
-                    except Exception as e:
-                        logger.warning(f"Error processing file {relative_path}: {str(e)}")
-                        continue
-                
-                if total_size > settings.MAX_REPO_SIZE:
-                    break
+                batch.append(file_data)
+                if len(batch) >= batch_size:
+                    files_count += len(batch)
+                    yield batch
+                    batch = []
             
-            logger.info(f"Processed {len(files_data)} files, total size: {total_size} bytes")
-            return files_data
+            if batch:
+                files_count += len(batch)
+                yield batch
+            
+            total_size = await scan_task
+            logger.info(f"Processed {files_count} files, total size: {total_size} bytes")
             
         except Exception as e:
             logger.error(f"Repository processing error: {str(e)}")
             raise ValueError(f"Failed to process repository: {str(e)}")
+        finally:
+            # Stops the pipeline if the consumer bails out early
+            for pending in (scan_task, *readers):
+                pending.cancel()
     
-    async def _read_file_content(self, file_path: str) -> Optional[str]:
-        """Read file content with encoding detection"""
+    async def _screen_file(self, file_path: str, relative_path: str, file_size: int) -> Optional[Dict[str, any]]:
+        """Read a candidate once and return its metadata, or None if it is binary or holds secrets"""
         try:
-            # Try UTF-8 first
-            async with aiofiles.open(file_path, 'r', encoding='utf-8') as f:
-                return await f.read()
-        except UnicodeDecodeError:
-            try:
-                # Try latin-1 as fallback
-                async with aiofiles.open(file_path, 'r', encoding='latin-1') as f:
-                    return await f.read()
-            except Exception:
-                logger.warning(f"Could not read file: {file_path}")
+            # Read file content once for screening; consumers re-read it
+            # lazily from content_path so the task never holds the whole repo;
+            # the reader returns None for binary files
+            content = await read_file_content(file_path)
+            if not content:
+                return None
+            if await self._contains_secrets(content):
                 return None
+            return {
+                "path": relative_path,
+                "content_path": file_path,
+                "language": self._detect_language(file_path),
+                "size": file_size
+            }
         except Exception as e:
-            logger.warning(f"Error reading file {file_path}: {str(e)}")
+            logger.warning(f"Error processing file {relative_path}: {str(e)}")
             return None
     
+    def _list_directory(self, directory: str) -> Tuple[List[Tuple[str, int]], List[str]]:
+        """Return (path, size) of processable files and the subdirectories worth descending into"""
+        files = []
+        subdirs = []
+        try:
+            with os.scandir(directory) as it:
+                entries = sorted(it, key=lambda e: e.name)
+        except OSError as e:
+            logger.warning(f"Error scanning directory {directory}: {str(e)}")
+            return files, subdirs
+        
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                # Filter directories
+                if not self.content_filter.should_ignore_directory(entry.name):
+                    subdirs.append(entry.path)
+            elif self.content_filter.should_process_file(entry):
+                # DirEntry caches stat, so the size costs no extra syscall
+                files.append((entry.path, entry.stat(follow_symlinks=False).st_size))
+        
+        return files, subdirs
+    
+    def _scan_repository(self, repo_path: str, emit: Callable[[Tuple[str, str, int]], None]) -> int:
+        """Walk the checkout, emitting (path, relative_path, size) for files within the size limits
+
+        Returns the total size of the emitted files.
+        """
+        total_size = 0
+        
+        # Breadth-first walk: each level's directories are listed and stat'ed in
+        # parallel, and map() keeps results in a deterministic order
+        with ThreadPoolExecutor(max_workers=SCAN_THREADS) as pool:
+            level = [repo_path]
+            while level:
+                next_level = []
+                for files, subdirs in pool.map(self._list_directory, level):
+                    next_level.extend(subdirs)
+                    
+                    for file_path, file_size in files:
+                        relative_path = os.path.relpath(file_path, repo_path)
+                        
+                        # Check file size
+                        if file_size > settings.MAX_FILE_SIZE:
+                            logger.warning(f"Skipping large file: {relative_path} ({file_size} bytes)")
+                            continue
+                        
+                        total_size += file_size
+                        if total_size > settings.MAX_REPO_SIZE:
+                            logger.warning("Repository size limit exceeded")
+                            return total_size
+                        
+                        emit((file_path, relative_path, file_size))
+                level = next_level
+        
+        return total_size
+    
     def _parse_github_url(self, url: str) -> Optional[str]:
         """Extract owner/repo from GitHub URL"""
-        try:
-            # Handle different URL formats
-            if url.startswith('https://github.com/'):
-                path = url.replace('https://github.com/', '').rstrip('.git')
-            elif url.startswith('git@github.com:'):
-                path = url.replace('git@github.com:', '').rstrip('.git')
-            else:
-                # Assume it's already in owner/repo format
-                path = url.strip('/')
-            
-            # Validate format
-            parts = path.split('/')
-            if len(parts) >= 2:
-                return f"{parts[0]}/{parts[1]}"
-            
-            return None
-        except Exception:
-            return None
+        match = _GITHUB_URL_RE.match(url)
+        return f"{match[1]}/{match[2]}" if match else None
     
     def _detect_language(self, file_path: str) -> str:
         """Detect programming language from file extension"""
-        ext = Path(file_path).suffix.lower()
-        
-        language_map = {
-            '.py': 'python',
-            '.js': 'javascript',
-            '.ts': 'typescript',
-            '.jsx': 'javascript',
-            '.tsx': 'typescript',
-            '.java': 'java',
-            '.cpp': 'cpp',
-            '.c': 'c',
-            '.cs': 'csharp',
-            '.php': 'php',
-            '.rb': 'ruby',
-            '.go': 'go',
-            '.rs': 'rust',
-            '.swift': 'swift',
-            '.kt': 'kotlin',
-            '.scala': 'scala',
-            '.clj': 'clojure',
-            '.sh': 'bash',
-            '.ps1': 'powershell',
-            '.sql': 'sql',
-            '.html': 'html',
-            '.css': 'css',
-            '.scss': 'scss',
-            '.less': 'less',
-            '.md': 'markdown',
-            '.yml': 'yaml',
-            '.yaml': 'yaml',
-            '.json': 'json',
-            '.xml': 'xml',
-            '.toml': 'toml',
-            '.ini': 'ini',
-            '.cfg': 'ini',
-            '.conf': 'ini'
-        }
-        
-        return language_map.get(ext, 'text')
+        return _ext_to_lang(os.path.splitext(file_path)[1].lower())
@@ -0,0 +1,14 @@
+from functools import lru_cache
+
+import openai
+
+from app.core.config import settings
+
+@lru_cache(maxsize=1)
+def get_openai_client() -> openai.AsyncOpenAI:
+    """One AsyncOpenAI per process, so every service shares its HTTP connection pool
+
+    Services that need other retry or timeout settings derive a client with
+    with_options(), which keeps the same underlying connection pool.
+    """
+    return openai.AsyncOpenAI(api_key=settings.OPENAI_API_KEY or None)
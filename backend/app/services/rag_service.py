@@ -1,17 +1,66 @@
-import openai
-from typing import List, Dict, Optional, Tuple
+from typing import AsyncIterator, List, Dict, Optional, Tuple
 import asyncio
 import logging
-from app.core.config import settings
+import re
+from functools import lru_cache
+import numpy as np
+from app.services.openai_client import get_openai_client
 from app.services.vector_service import VectorService
 
 logger = logging.getLogger(__name__)
 
+# Probes for sampling a repository before suggesting questions; run as one batch
+SUGGESTION_SAMPLE_QUERIES = (
+    "main function class API",
+    "configuration and setup",
+    "core data models and types"
+)
+SUGGESTION_SAMPLE_SIZE = 5
+
+# One line of the suggestion reply with surrounding whitespace and any leading
+# bullet ("- ") or numbering ("1. ") captured out of the question text
+SUGGESTION_LINE_RE = re.compile(r'^[^\S\n]*[- ]*[0-9. ]*(.*?)[^\S\n]*$', re.MULTILINE)
+
+# Tokens for the "\n---\n" that closes each context chunk
+CHUNK_SEPARATOR_TOKENS = 2
+
+# System prompt pieces around the repository header and the retrieved context
+SYSTEM_PROMPT_INTRO = """You are an expert code assistant helping users understand a specific repository. 
+        
+        """
+SYSTEM_PROMPT_GUIDELINES = """
+        
+        Your task is to answer questions about this codebase using the provided context. 
+        
+        Guidelines:
+        - Provide accurate, helpful answers based on the code context
+        - Reference specific files and functions when relevant
+        - If you're not sure about something, say so clearly
+        - Provide code examples when helpful
+        - Be concise but thorough
+        - If the context doesn't contain enough information, acknowledge this
+        
+        Context from the repository:
+        """
+SYSTEM_PROMPT_END = """
+        """
+
+@lru_cache(maxsize=256)
+def _render_repo_header(name: str, description: str, language: str) -> str:
+    """Repository block of the system prompt, rendered once per repository"""
+    return f"""
+            Repository Information:
+            - Name: {name}
+            - Description: {description}
+            - Main Language: {language}
+            """
+
 class RAGService:
-    def __init__(self):
-        openai.api_key = settings.OPENAI_API_KEY
-        self.client = openai.AsyncOpenAI()
-        self.vector_service = VectorService()
+    def __init__(self, vector_service: Optional[VectorService] = None):
+        # The SDK retries rate limits, timeouts and 5xx with exponential backoff
+        self.client = get_openai_client().with_options(max_retries=3, timeout=30)
+        # Share the caller's VectorService so the embedding model is loaded once
+        self.vector_service = vector_service or VectorService()
         self.max_context_tokens = 3000
         
     async def answer_question(
@@ -19,26 +68,13 @@ class RAGService:
         collection_name: str,
         question: str,
         conversation_history: List[Dict[str, str]] = None,
-        repository_info: Dict[str, any] = None
+        repository_info: Dict[str, any] = None,
+        query_embedding: Optional[List[float]] = None
     ) -> Dict[str, any]:
         """Answer a question using RAG"""
         try:
-            # Retrieve relevant context
-            context_chunks = await self.vector_service.search_similar(
-                collection_name=collection_name,
-                query=question,
-                n_results=8
-            )
-            
-            # Build context
-            context = self._build_context(context_chunks)
-            
-            # Prepare conversation
-            messages = self._prepare_messages(
-                question=question,
-                context=context,
-                conversation_history=conversation_history or [],
-                repository_info=repository_info
+            context_chunks, messages = await self._retrieve_and_prepare(
+                collection_name, question, conversation_history, repository_info, query_embedding
             )
             
             # Generate response
@@ -50,45 +86,163 @@ class RAGService:
                 stream=False
             )
             
-            answer = response.choices[0].message.content
-            
             return {
-                'answer': answer,
-                'context_used': [
-                    {
-                        'file_path': chunk['metadata']['file_path'],
-                        'chunk_type': chunk['metadata'].get('chunk_type', 'unknown'),
-                        'relevance_score': 1 - chunk['distance']  # Convert distance to relevance
-                    }
-                    for chunk in context_chunks[:3]  # Top 3 most relevant
-                ],
-                'sources': list(set(chunk['metadata']['file_path'] for chunk in context_chunks))
+                'answer': response.choices[0].message.content,
+                **self._answer_metadata(context_chunks)
+            }
+            
+        except Exception as e:
+            logger.error(f"RAG answer generation error: {str(e)}")
+            raise ValueError(f"Failed to generate answer: {str(e)}")
+    
+    async def answer_question_stream(
+        self,
+        collection_name: str,
+        question: str,
+        conversation_history: List[Dict[str, str]] = None,
+        repository_info: Dict[str, any] = None
+    ) -> AsyncIterator[Dict[str, any]]:
+        """Answer a question using RAG, yielding answer text as it is generated
+
+        Yields {'type': 'token', 'content': ...} events, then one final
+        {'type': 'done', 'answer', 'context_used', 'sources'} event.
+        """
+        try:
+            context_chunks, messages = await self._retrieve_and_prepare(
+                collection_name, question, conversation_history, repository_info
+            )
+            
+            stream = await self.client.chat.completions.create(
+                model="gpt-4-turbo-preview",
+                messages=messages,
+                temperature=0.1,
+                max_tokens=1000,
+                stream=True
+            )
+            
+            parts = []
+            async for chunk in stream:
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    parts.append(delta)
+                    yield {'type': 'token', 'content': delta}
+            
+            yield {
+                'type': 'done',
+                'answer': ''.join(parts),
+                **self._answer_metadata(context_chunks)
             }
             
         except Exception as e:
             logger.error(f"RAG answer generation error: {str(e)}")
             raise ValueError(f"Failed to generate answer: {str(e)}")
     
+    async def _retrieve_and_prepare(
+        self,
+        collection_name: str,
+        question: str,
+        conversation_history: Optional[List[Dict[str, str]]],
+        repository_info: Optional[Dict[str, any]],
+        query_embedding: Optional[List[float]] = None
+    ) -> Tuple[List[Dict[str, any]], List[Dict[str, str]]]:
+        """Retrieve context for a question and build the chat messages around it"""
+        # Retrieve relevant context
+        context_chunks = await self.vector_service.search_similar(
+            collection_name=collection_name,
+            query=question,
+            n_results=8,
+            query_embedding=query_embedding
+        )
+        
+        # Build context
+        context = self._build_context(context_chunks)
+        
+        # Prepare conversation
+        messages = self._prepare_messages(
+            question=question,
+            context=context,
+            conversation_history=conversation_history or [],
+            repository_info=repository_info
+        )
+        return context_chunks, messages
+    
+    def _answer_metadata(self, context_chunks: List[Dict[str, any]]) -> Dict[str, any]:
+        """Context and source references reported alongside an answer"""
+        context_used = []
+        # Source files in retrieval order, most relevant first, each listed once
+        sources = {}
+        for rank, chunk in enumerate(context_chunks):
+            file_path = chunk['metadata']['file_path']
+            sources.setdefault(file_path, None)
+            if rank < 3:  # Top 3 most relevant
+                context_used.append({
+                    'file_path': file_path,
+                    'chunk_type': chunk['metadata'].get('chunk_type', 'unknown'),
+                    'relevance_score': 1 - chunk['distance']  # Convert distance to relevance
+                })
+        
+        return {
+            'context_used': context_used,
+            'sources': list(sources)
+        }
+    
+    async def bootstrap_chat(
+        self,
+        collection_name: str,
+        question: str,
+        conversation_history: List[Dict[str, str]] = None,
+        repository_info: Dict[str, any] = None
+    ) -> Tuple[Dict[str, any], List[str]]:
+        """Answer the opening question of a conversation and suggest follow-ups concurrently"""
+        # Independent retrievals and completions; the slower one bounds the latency
+        return await asyncio.gather(
+            self.answer_question(
+                collection_name=collection_name,
+                question=question,
+                conversation_history=conversation_history,
+                repository_info=repository_info
+            ),
+            self.generate_suggested_questions(collection_name, repository_info or {})
+        )
+    
+    def _interleave_unique(self, result_lists: List[List[Dict[str, any]]], limit: int) -> List[Dict[str, any]]:
+        """Merge per-query results rank by rank, dropping repeated chunks"""
+        merged = []
+        seen = set()
+        for rank in range(max((len(results) for results in result_lists), default=0)):
+            for results in result_lists:
+                if rank >= len(results):
+                    continue
+                chunk = results[rank]
+                key = (chunk['metadata'].get('file_path'), chunk['content'])
+                if key in seen:
+                    continue
+                seen.add(key)
+                merged.append(chunk)
+                if len(merged) >= limit:
+                    return merged
+        return merged
+    
     def _build_context(self, chunks: List[Dict[str, any]]) -> str:
         """Build context string from retrieved chunks"""
-        context_parts = []
-        total_tokens = 0
-        
+        parts = []
+        counts = []
         for chunk in chunks:
-            chunk_content = f"File: {chunk['metadata']['file_path']}\n"
-            chunk_content += f"Language: {chunk['metadata'].get('language', 'unknown')}\n"
-            chunk_content += f"Content:\n{chunk['content']}\n"
-            chunk_content += "---\n"
-            
-            chunk_tokens = self.vector_service.count_tokens(chunk_content)
-            
-            if total_tokens + chunk_tokens > self.max_context_tokens:
-                break
-                
-            context_parts.append(chunk_content)
-            total_tokens += chunk_tokens
+            header = f"File: {chunk['metadata']['file_path']}\nLanguage: {chunk['metadata'].get('language', 'unknown')}\nContent:\n"
+            parts.append(f"{header}{chunk['content']}\n---\n")
+            
+            # Content tokens were counted at ingest; collections indexed before
+            # that fall back to counting (memoized) here
+            content_tokens = chunk['metadata'].get('token_count')
+            if content_tokens is None:
+                content_tokens = self.vector_service.count_tokens(chunk['content'])
+            counts.append(self.vector_service.count_tokens(header) + content_tokens + CHUNK_SEPARATOR_TOKENS)
         
-        return "\n".join(context_parts)
+        # Keep the longest prefix of chunks that fits the token budget
+        fitting = int(np.searchsorted(np.cumsum(counts), self.max_context_tokens, side='right'))
+        return "\n".join(parts[:fitting])
     
     def _prepare_messages(
         self,
@@ -101,30 +255,14 @@ class RAGService:
         
         repo_context = ""
         if repository_info:
-            repo_context = f"""
-            Repository Information:
-            - Name: {repository_info.get('name', 'Unknown')}
-            - Description: {repository_info.get('description', 'No description')}
-            - Main Language: {repository_info.get('language', 'Unknown')}
-            """
-        
-        system_message = f"""You are an expert code assistant helping users understand a specific repository. 
-        
-        {repo_context}
-        
-        Your task is to answer questions about this codebase using the provided context. 
-        
-        Guidelines:
-        - Provide accurate, helpful answers based on the code context
-        - Reference specific files and functions when relevant
-        - If you're not sure about something, say so clearly
-        - Provide code examples when helpful
-        - Be concise but thorough
-        - If the context doesn't contain enough information, acknowledge this
+            repo_context = _render_repo_header(
+                repository_info.get('name', 'Unknown'),
+                repository_info.get('description', 'No description'),
+                repository_info.get('language', 'Unknown')
+            )
         
-        Context from the repository:
-        {context}
-        """
+        # Only the retrieved context changes between questions about a repository
+        system_message = "".join((SYSTEM_PROMPT_INTRO, repo_context, SYSTEM_PROMPT_GUIDELINES, context, SYSTEM_PROMPT_END))
         
         messages = [{"role": "system", "content": system_message}]
         
@@ -147,12 +285,14 @@ class RAGService:
     ) -> List[str]:
         """Generate suggested questions based on repository content"""
         try:
-            # Get a sample of different file types
-            sample_chunks = await self.vector_service.search_similar(
+            # Get a sample of different file types: one embedding batch and one
+            # index query cover every probe
+            probe_results = await self.vector_service.batch_search_similar(
                 collection_name=collection_name,
-                query="main function class API",
-                n_results=5
+                queries=list(SUGGESTION_SAMPLE_QUERIES),
+                n_results=SUGGESTION_SAMPLE_SIZE
             )
+            sample_chunks = self._interleave_unique(probe_results, SUGGESTION_SAMPLE_SIZE)
             
             context_sample = "\n".join([
                 f"File: {chunk['metadata']['file_path']}\n{chunk['content'][:200]}..."
@@ -189,9 +329,9 @@ class RAGService:
             )
             
             questions = [
-                q.strip().lstrip('- ').lstrip('1234567890. ')
-                for q in response.choices[0].message.content.split('\n')
-                if q.strip() and '?' in q
+                match.group(1)
+                for match in SUGGESTION_LINE_RE.finditer(response.choices[0].message.content)
+                if '?' in match.group(1)
             ]
             
             return questions[:7]  # Limit to 7 questions
@@ -0,0 +1,86 @@
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+class SemanticCache:
+    """In-process LRU + TTL cache keyed on query embedding similarity
+
+    Entries are grouped by namespace (e.g. one per repository). A lookup
+    returns the stored value of the most similar cached query if its cosine
+    similarity clears the threshold.
+    """
+
+    def __init__(self, threshold: float = 0.95, max_size: int = 2000, ttl: float = 600):
+        self.threshold = threshold
+        self.max_size = max_size
+        self.ttl = ttl
+        self._lock = threading.RLock()
+        self._matrices: Dict[str, np.ndarray] = {}
+        self._values: Dict[str, List[Any]] = {}
+        self._stored_at: Dict[str, List[float]] = {}
+        self._used_at: Dict[str, List[float]] = {}
+
+    @staticmethod
+    def _normalize(embedding) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+    def _drop(self, namespace: str, indices: List[int]):
+        """Remove entries by row index (caller holds the lock)"""
+        self._matrices[namespace] = np.delete(self._matrices[namespace], indices, axis=0)
+        for column in (self._values, self._stored_at, self._used_at):
+            rows = column[namespace]
+            for index in sorted(indices, reverse=True):
+                del rows[index]
+
+    def _expire(self, namespace: str, now: float):
+        expired = [i for i, stored in enumerate(self._stored_at[namespace]) if now - stored > self.ttl]
+        if expired:
+            self._drop(namespace, expired)
+
+    def get(self, namespace: str, embedding) -> Optional[Any]:
+        """Return the cached value for the closest matching query, or None"""
+        query = self._normalize(embedding)
+        now = time.monotonic()
+
+        with self._lock:
+            if namespace not in self._matrices:
+                return None
+            self._expire(namespace, now)
+
+            matrix = self._matrices[namespace]
+            if not len(matrix):
+                return None
+
+            # One matrix-vector product scores every cached query
+            scores = matrix @ query
+            best = int(np.argmax(scores))
+            if scores[best] < self.threshold:
+                return None
+
+            self._used_at[namespace][best] = now
+            return self._values[namespace][best]
+
+    def set(self, namespace: str, embedding, value: Any):
+        """Cache value under a query embedding, evicting the least recently used entry if full"""
+        query = self._normalize(embedding)
+        now = time.monotonic()
+
+        with self._lock:
+            if namespace not in self._matrices:
+                self._matrices[namespace] = np.empty((0, query.shape[0]), dtype=np.float32)
+                self._values[namespace] = []
+                self._stored_at[namespace] = []
+                self._used_at[namespace] = []
+            else:
+                self._expire(namespace, now)
+                if len(self._values[namespace]) >= self.max_size:
+                    self._drop(namespace, [int(np.argmin(self._used_at[namespace]))])
+
+            self._matrices[namespace] = np.vstack([self._matrices[namespace], query])
+            self._values[namespace].append(value)
+            self._stored_at[namespace].append(now)
+            self._used_at[namespace].append(now)
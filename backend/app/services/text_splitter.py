@@ -1,5 +1,10 @@
+import asyncio
 import re
-from typing import List, Dict, Optional
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from hashlib import blake2b
+from typing import List, Optional, Tuple
 import tree_sitter
 import tree_sitter_python
 import tree_sitter_javascript
@@ -8,6 +13,36 @@ from pathlib import Path
 
 from app.core.config import settings
 
+AST_CONSTRUCT_TYPES = ('function_definition', 'class_definition', 'method_definition')
+AST_CACHE_SIZE = 512  # files whose top-level constructs are remembered
+
+# Start of a line whose first non-blank character is '#'
+MARKDOWN_HEADER_RE = re.compile(r'^[^\S\n]*#', re.MULTILINE)
+
+def _line_offsets(lines: List[str]) -> List[int]:
+    """Start offset of every line in the content lines came from, plus one past the end
+
+    Lines a..b (inclusive) are content[offsets[a]:offsets[b + 1] - 1], so chunks
+    are sliced straight out of content instead of being re-joined from lines.
+    """
+    offsets = [0]
+    offset = 0
+    for line in lines:
+        offset += len(line) + 1
+        offsets.append(offset)
+    return offsets
+
+@dataclass(slots=True)
+class CodeChunk:
+    """One chunk of a file as produced by TextSplitter"""
+    content: str
+    type: str
+    start_line: int
+    end_line: int
+    language: str
+    file_path: str
+    title: Optional[str] = None  # markdown sections only
+
 class TextSplitter:
     def __init__(self):
         self.chunk_size = settings.CHUNK_SIZE
@@ -16,6 +51,13 @@ class TextSplitter:
         # Initialize tree-sitter parsers
         self.parsers = {}
         self._setup_parsers()
+        
+        # (language, content digest) -> top-level (type, start_line, end_line);
+        # unchanged files seen again, e.g. on re-ingest, skip the parse entirely
+        self._ast_cache: OrderedDict = OrderedDict()
+        # Splitting runs on worker threads; tree-sitter parsers and the cache
+        # must not be used by two of them at once
+        self._ast_lock = threading.Lock()
     
     def _setup_parsers(self):
         """Setup tree-sitter parsers for different languages"""
@@ -41,52 +83,72 @@ class TextSplitter:
         except Exception as e:
             print(f"Warning: Could not initialize tree-sitter parsers: {e}")
     
-    async def split_code(self, content: str, language: str, file_path: str) -> List[Dict[str, any]]:
+    async def split_code(self, content: str, language: str, file_path: str) -> List[CodeChunk]:
         """Split code content into meaningful chunks"""
-        
+        # Parsing and splitting are CPU-bound; keep them off the event loop
+        return await asyncio.to_thread(self._split_code, content, language, file_path)
+    
+    def _split_code(self, content: str, language: str, file_path: str) -> List[CodeChunk]:
+        """Synchronous body of split_code"""
         # Try AST-based splitting first
         if language in self.parsers:
             try:
-                return await self._split_with_ast(content, language, file_path)
+                return self._split_with_ast(content, language, file_path)
             except Exception as e:
                 print(f"AST parsing failed for {file_path}, falling back to text splitting: {e}")
         
         # Fall back to text-based splitting
-        return await self._split_by_text(content, language, file_path)
+        return self._split_by_text(content, language, file_path)
     
-    async def _split_with_ast(self, content: str, language: str, file_path: str) -> List[Dict[str, any]]:
+    def _split_with_ast(self, content: str, language: str, file_path: str) -> List[CodeChunk]:
         """Split code using AST parsing"""
-        parser = self.parsers[language]
-        tree = parser.parse(bytes(content, 'utf-8'))
+        constructs = self._top_level_constructs(content, language)
         
         chunks = []
-        lines = content.split('\n')
+        offsets = _line_offsets(content.split('\n'))
         
-        # Extract top-level constructs
-        for node in tree.root_node.children:
-            if node.type in ['function_definition', 'class_definition', 'method_definition']:
-                start_line = node.start_point[0]
-                end_line = node.end_point[0]
-                
-                # Get the content of this construct
-                chunk_content = '\n'.join(lines[start_line:end_line + 1])
-                
-                chunks.append({
-                    'content': chunk_content,
-                    'type': node.type,
-                    'start_line': start_line,
-                    'end_line': end_line,
-                    'language': language,
-                    'file_path': file_path
-                })
+        for node_type, start_line, end_line in constructs:
+            # Get the content of this construct
+            chunk_content = content[offsets[start_line]:offsets[end_line + 1] - 1]
+            
+            chunks.append(CodeChunk(
+                content=chunk_content,
+                type=node_type,
+                start_line=start_line,
+                end_line=end_line,
+                language=language,
+                file_path=file_path
+            ))
         
         # If no functions/classes found, split by text
         if not chunks:
-            return await self._split_by_text(content, language, file_path)
+            return self._split_by_text(content, language, file_path)
         
         return chunks
     
-    async def _split_by_text(self, content: str, language: str, file_path: str) -> List[Dict[str, any]]:
+    def _top_level_constructs(self, content: str, language: str) -> Tuple[Tuple[str, int, int], ...]:
+        """Top-level functions and classes as (type, start_line, end_line), memoized by content"""
+        data = content.encode('utf-8')
+        key = (language, blake2b(data, digest_size=16).digest())
+        with self._ast_lock:
+            constructs = self._ast_cache.get(key)
+            if constructs is not None:
+                self._ast_cache.move_to_end(key)
+                return constructs
+            
+            tree = self.parsers[language].parse(data)
+            constructs = tuple(
+                (node.type, node.start_point[0], node.end_point[0])
+                for node in tree.root_node.children
+                if node.type in AST_CONSTRUCT_TYPES
+            )
+            
+            self._ast_cache[key] = constructs
+            if len(self._ast_cache) > AST_CACHE_SIZE:
+                self._ast_cache.popitem(last=False)
+        return constructs
+    
+    def _split_by_text(self, content: str, language: str, file_path: str) -> List[CodeChunk]:
         """Split content by text-based rules"""
         
         # For markdown files, split by sections
@@ -96,90 +158,88 @@ class TextSplitter:
         # For other files, use sliding window approach
         chunks = []
         lines = content.split('\n')
+        offsets = _line_offsets(lines)
         
-        current_chunk = []
+        # The current chunk is lines[start:i]; its size (newlines excluded) is
+        # kept up to date as lines are added rather than re-summed
+        start = 0
         current_size = 0
         
         for i, line in enumerate(lines):
             line_size = len(line)
             
-            if current_size + line_size > self.chunk_size and current_chunk:
+            if current_size + line_size > self.chunk_size and i > start:
                 # Create chunk
-                chunk_content = '\n'.join(current_chunk)
-                chunks.append({
-                    'content': chunk_content,
-                    'type': 'text_chunk',
-                    'start_line': i - len(current_chunk),
-                    'end_line': i - 1,
-                    'language': language,
-                    'file_path': file_path
-                })
+                chunks.append(CodeChunk(
+                    content=content[offsets[start]:offsets[i] - 1],
+                    type='text_chunk',
+                    start_line=start,
+                    end_line=i - 1,
+                    language=language,
+                    file_path=file_path
+                ))
                 
-                # Start new chunk with overlap
-                overlap_lines = max(1, len(current_chunk) * self.chunk_overlap // self.chunk_size)
-                current_chunk = current_chunk[-overlap_lines:] if overlap_lines > 0 else []
-                current_size = sum(len(l) for l in current_chunk)
+                # Start new chunk with overlap (at most the whole chunk, even if
+                # CHUNK_OVERLAP exceeds CHUNK_SIZE)
+                overlap_lines = min(i - start, max(1, (i - start) * self.chunk_overlap // self.chunk_size))
+                start = i - overlap_lines
+                current_size = offsets[i] - offsets[start] - overlap_lines
             
-            current_chunk.append(line)
             current_size += line_size
         
         # Add final chunk
-        if current_chunk:
-            chunk_content = '\n'.join(current_chunk)
-            chunks.append({
-                'content': chunk_content,
-                'type': 'text_chunk',
-                'start_line': len(lines) - len(current_chunk),
-                'end_line': len(lines) - 1,
-                'language': language,
-                'file_path': file_path
-            })
+        if lines:
+            chunks.append(CodeChunk(
+                content=content[offsets[start]:],
+                type='text_chunk',
+                start_line=start,
+                end_line=len(lines) - 1,
+                language=language,
+                file_path=file_path
+            ))
         
         return chunks
     
-    def _split_markdown(self, content: str, file_path: str) -> List[Dict[str, any]]:
+    def _split_markdown(self, content: str, file_path: str) -> List[CodeChunk]:
         """Split markdown by sections"""
         chunks = []
-        lines = content.split('\n')
         
-        current_section = []
         current_title = "Introduction"
+        start = 0  # offset of the current section
         start_line = 0
         
-        for i, line in enumerate(lines):
-            # Check for header
-            if line.strip().startswith('#'):
-                # Save previous section
-                if current_section:
-                    chunk_content = '\n'.join(current_section)
-                    chunks.append({
-                        'content': chunk_content,
-                        'type': 'markdown_section',
-                        'title': current_title,
-                        'start_line': start_line,
-                        'end_line': i - 1,
-                        'language': 'markdown',
-                        'file_path': file_path
-                    })
-                
-                # Start new section
-                current_title = line.strip('# ')
-                current_section = [line]
-                start_line = i
-            else:
-                current_section.append(line)
+        # Header lines are found in one regex scan; sections are sliced between them
+        for match in MARKDOWN_HEADER_RE.finditer(content):
+            pos = match.start()
+            line_no = start_line + content.count('\n', start, pos)
+            
+            # Save previous section (there is none when the file opens with a header)
+            if pos > 0:
+                chunks.append(CodeChunk(
+                    content=content[start:pos - 1],
+                    type='markdown_section',
+                    title=current_title,
+                    start_line=start_line,
+                    end_line=line_no - 1,
+                    language='markdown',
+                    file_path=file_path
+                ))
+            
+            # Start new section
+            line_end = content.find('\n', pos)
+            current_title = content[pos:line_end if line_end != -1 else len(content)].strip('# ')
+            start = pos
+            start_line = line_no
         
         # Add final section
-        if current_section:
-            chunk_content = '\n'.join(current_section)
-            chunks.append({
-                'content': chunk_content,
-                'type': 'markdown_section',
-                'title': current_title,
-                'start_line': start_line,
-                'end_line': len(lines) - 1,
-                'language': 'markdown',
-                'file_path': file_path
-            })
+        chunks.append(CodeChunk(
+            content=content[start:],
+            type='markdown_section',
+            title=current_title,
+            start_line=start_line,
+            end_line=start_line + content.count('\n', start),
+            language='markdown',
+            file_path=file_path
+        ))
         
         return chunks
@@ -1,32 +1,106 @@
 import chromadb
 from chromadb.config import Settings as ChromaSettings
 import uuid
-from typing import List, Dict, Optional, Tuple
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from hashlib import blake2b
+from typing import AsyncIterator, List, Dict, Optional, Tuple
 import logging
+import numpy as np
 from sentence_transformers import SentenceTransformer
 import tiktoken
 import asyncio
-from concurrent.futures import ThreadPoolExecutor
 
 from app.core.config import settings
+from app.services.embedding_batcher import EmbeddingBatcher
+from app.services.embedding_cache import EmbeddingCache
+from app.services.file_reader import load_content
 from app.services.text_splitter import TextSplitter
 
 logger = logging.getLogger(__name__)
 
+# HNSW index settings for new collections. Embeddings are unit-normalized, so
+# cosine distance is 1 - cosine similarity and relevance = 1 - distance holds
+HNSW_METADATA = {
+    "hnsw:space": "cosine",
+    "hnsw:M": 32,
+    "hnsw:construction_ef": 200,
+    "hnsw:search_ef": 128
+}
+
+def _select_embedding_device() -> str:
+    """Device for the embedding model: EMBEDDING_DEVICE if set, else CUDA when available"""
+    if settings.EMBEDDING_DEVICE:
+        return settings.EMBEDDING_DEVICE
+    try:
+        import torch
+        return "cuda" if torch.cuda.is_available() else "cpu"
+    except ImportError:
+        return "cpu"
+
+# The Chroma client and the embedding model are process-wide: opening the
+# persistent store and loading model weights are the costly parts of building a
+# VectorService, and every instance in a process can share them
+
+@lru_cache(maxsize=1)
+def get_chroma_client() -> chromadb.PersistentClient:
+    """Chroma client for CHROMA_PATH, opened once per process"""
+    return chromadb.PersistentClient(
+        path=settings.CHROMA_PATH,
+        settings=ChromaSettings(
+            anonymized_telemetry=False,
+            allow_reset=True
+        )
+    )
+
+@lru_cache(maxsize=None)
+def get_embedding_model(model_name: str, device: str) -> SentenceTransformer:
+    """Embedding model loaded once per process and device
+
+    On a GPU it runs in half precision, which keeps unit-normalized MiniLM
+    embeddings well within cosine tolerance.
+    """
+    model = SentenceTransformer(model_name, device=device)
+    if device.startswith("cuda"):
+        model.half()
+    return model
+
+# Chunks embedded and written to Chroma per batch, and batches allowed to wait
+# for the writer before embedding pauses
+WRITE_BATCH_SIZE = 256
+WRITE_QUEUE_DEPTH = 4
+
+COLLECTION_CACHE_SIZE = 512  # collection handles kept per service
+
 class VectorService:
     def __init__(self):
-        self.client = chromadb.PersistentClient(
-            path=settings.CHROMA_PATH,
-            settings=ChromaSettings(
-                anonymized_telemetry=False,
-                allow_reset=True
-            )
-        )
+        self.client = get_chroma_client()
+        # Collection handles by name; get_collection reads Chroma's sqlite
+        # metadata, which is not worth repeating for every query
+        self._collections: Dict[str, any] = {}
         
         # Initialize embedding model
-        self.embedding_model = SentenceTransformer('all-MiniLM-L6-v2')
+        self.device = _select_embedding_device()
+        self.embedding_model = get_embedding_model(settings.EMBEDDING_MODEL, self.device)
+        self.embedding_cache = EmbeddingCache(settings.EMBEDDING_MODEL)
         self.text_splitter = TextSplitter()
-        self.executor = ThreadPoolExecutor(max_workers=4)
+        # The batcher runs one model call at a time on the loop's default thread
+        # pool, which also keeps a GPU from being driven by competing threads
+        self.embedding_batcher = EmbeddingBatcher(
+            self._encode,
+            max_batch_size=settings.EMBEDDING_BATCH_SIZE,
+            max_wait_ms=settings.EMBEDDING_BATCH_WAIT_MS
+        )
+        # Set once the multi-process pool fails to start, e.g. in a daemonic
+        # Celery prefork child, so later ingests go straight to the batcher
+        self._embedding_pool_disabled = False
+        
+        # In-process LRU of query embeddings: repeated questions skip the model
+        # and the Redis round trip entirely
+        self._query_cache: OrderedDict = OrderedDict()
+        self._query_cache_lock = threading.RLock()
         
         # Initialize tokenizer for context management
         try:
@@ -34,11 +108,19 @@ class VectorService:
         except Exception:
             logger.warning("Could not load tiktoken encoder, using approximate token counting")
             self.tokenizer = None
+        
+        # Retrieved chunks and prompt fragments repeat across questions
+        self._cached_token_count = lru_cache(maxsize=8192)(self._token_count)
+    
+    @staticmethod
+    def collection_name_for(repo_id) -> str:
+        """Build the collection name for a repository id (str or UUID)"""
+        return f"repo_{str(repo_id).replace('-', '_')}"
     
     async def create_collection(self, repo_id: str) -> str:
         """Create a vector collection for a repository"""
         try:
-            collection_name = f"repo_{repo_id.replace('-', '_')}"
+            collection_name = self.collection_name_for(repo_id)
             
             # Delete existing collection if it exists
             try:
@@ -46,10 +128,12 @@ class VectorService:
             except Exception:
                 pass  # Collection doesn't exist
             
+            self._collections.pop(collection_name, None)
             collection = self.client.create_collection(
                 name=collection_name,
-                metadata={"repository_id": repo_id}
+                metadata={**HNSW_METADATA, "repository_id": repo_id}
             )
+            self._remember_collection(collection_name, collection)
             
             logger.info(f"Created vector collection: {collection_name}")
             return collection_name
@@ -61,51 +145,48 @@ class VectorService:
     async def add_documents(self, collection_name: str, documents: List[Dict[str, any]]) -> List[str]:
         """Add documents to vector collection"""
         try:
-            collection = self.client.get_collection(name=collection_name)
+            collection = self._get_collection(collection_name)
             
-            all_chunks = []
-            all_embeddings = []
-            all_metadatas = []
             all_ids = []
+            pool = None
             
-            for doc in documents:
-                # Split document into chunks
-                chunks = await self.text_splitter.split_code(
-                    doc['content'], 
-                    doc['language'],
-                    doc['path']
-                )
-                
-                for i, chunk in enumerate(chunks):
-                    chunk_id = str(uuid.uuid4())
+            # Files are split, embedded and written one batch at a time, so only
+            # a few batches of chunks and embeddings are ever held in memory;
+            # each batch is written while the next one is embedded
+            queue: asyncio.Queue = asyncio.Queue(maxsize=WRITE_QUEUE_DEPTH)
+            writer = asyncio.create_task(self._write_batches(collection, queue))
+            unique_total = cache_hits = 0
+            try:
+                async for ids, chunks, metadatas in self._chunk_batches(documents):
+                    # Once an ingest proves large it fans out over one model per CPU
+                    # core or GPU; the pool is shared by the rest of its batches
+                    if (
+                        pool is None
+                        and not self._embedding_pool_disabled
+                        and len(all_ids) + len(ids) >= settings.EMBEDDING_MULTI_PROCESS_MIN_CHUNKS
+                    ):
+                        pool = await self._start_embedding_pool()
                     
-                    all_chunks.append(chunk['content'])
-                    all_metadatas.append({
-                        'file_path': doc['path'],
-                        'language': doc['language'],
-                        'chunk_index': i,
-                        'chunk_type': chunk['type'],
-                        'start_line': chunk.get('start_line', 0),
-                        'end_line': chunk.get('end_line', 0)
-                    })
-                    all_ids.append(chunk_id)
-            
-            # Generate embeddings in batches
-            batch_size = 32
-            for i in range(0, len(all_chunks), batch_size):
-                batch_chunks = all_chunks[i:i+batch_size]
-                batch_embeddings = await self._generate_embeddings(batch_chunks)
-                all_embeddings.extend(batch_embeddings)
-            
-            # Add to collection
-            collection.add(
-                documents=all_chunks,
-                embeddings=all_embeddings,
-                metadatas=all_metadatas,
-                ids=all_ids
+                    embeddings, unique, hits = await self._embed_chunks(chunks, pool)
+                    unique_total += unique
+                    cache_hits += hits
+                    await self._enqueue_batch(queue, writer, (ids, chunks, embeddings, metadatas))
+                    all_ids.extend(ids)
+                await self._enqueue_batch(queue, writer, None)
+                await writer
+            finally:
+                if not writer.done():
+                    writer.cancel()
+                if pool is not None:
+                    # Joins the pool's processes
+                    await asyncio.to_thread(self.embedding_model.stop_multi_process_pool, pool)
+            
+            logger.info(
+                f"Embedding {len(all_ids)} chunks: {unique_total} unique per batch, "
+                f"{cache_hits} cache hits"
             )
             
-            logger.info(f"Added {len(all_chunks)} chunks to collection {collection_name}")
+            logger.info(f"Added {len(all_ids)} chunks to collection {collection_name}")
             return all_ids
             
         except Exception as e:
@@ -117,18 +198,19 @@ class VectorService:
         collection_name: str, 
         query: str, 
         n_results: int = 5,
-        filter_dict: Optional[Dict] = None
+        filter_dict: Optional[Dict] = None,
+        query_embedding: Optional[List[float]] = None
     ) -> List[Dict[str, any]]:
         """Search for similar content in vector collection"""
         try:
-            collection = self.client.get_collection(name=collection_name)
-            
-            # Generate query embedding
-            query_embedding = await self._generate_embeddings([query])
+            # Generate query embedding unless the caller already has it
+            if query_embedding is None:
+                query_embedding = (await self._embed_queries([query]))[0]
             
             # Search
-            results = collection.query(
-                query_embeddings=query_embedding,
+            results = await self._query_collection(
+                collection_name,
+                query_embeddings=[query_embedding],
                 n_results=n_results,
                 where=filter_dict,
                 include=['documents', 'metadatas', 'distances']
@@ -150,22 +232,275 @@ class VectorService:
             logger.error(f"Error searching vectors: {str(e)}")
             raise ValueError(f"Vector search failed: {str(e)}")
     
+    async def batch_search_similar(
+        self,
+        collection_name: str,
+        queries: List[str],
+        n_results: int = 5,
+        filter_dict: Optional[Dict] = None,
+        query_embeddings: Optional[List[List[float]]] = None
+    ) -> List[List[Dict[str, any]]]:
+        """Search for several queries at once: one embedding batch and one index query"""
+        if not queries:
+            return []
+        try:
+            if query_embeddings is None:
+                query_embeddings = await self._embed_queries(queries)
+            
+            results = await self._query_collection(
+                collection_name,
+                query_embeddings=query_embeddings,
+                n_results=n_results,
+                where=filter_dict,
+                include=['documents', 'metadatas', 'distances']
+            )
+            
+            # Results come back as one row per query
+            formatted_results = []
+            for documents, metadatas, distances in zip(
+                results['documents'] or [[]] * len(queries),
+                results['metadatas'] or [[]] * len(queries),
+                results['distances'] or [[]] * len(queries)
+            ):
+                formatted_results.append([
+                    {'content': content, 'metadata': metadata, 'distance': distance}
+                    for content, metadata, distance in zip(documents, metadatas, distances)
+                ])
+            
+            return formatted_results
+            
+        except Exception as e:
+            logger.error(f"Error searching vectors: {str(e)}")
+            raise ValueError(f"Vector search failed: {str(e)}")
+    
+    def _get_collection(self, collection_name: str):
+        """Collection handle, looked up in Chroma once per name"""
+        collection = self._collections.get(collection_name)
+        if collection is None:
+            collection = self.client.get_collection(name=collection_name)
+            self._remember_collection(collection_name, collection)
+        return collection
+    
+    def _remember_collection(self, collection_name: str, collection):
+        """Cache a handle, keeping at most COLLECTION_CACHE_SIZE"""
+        self._collections[collection_name] = collection
+        if len(self._collections) > COLLECTION_CACHE_SIZE:
+            # Drop the oldest handle
+            self._collections.pop(next(iter(self._collections)))
+    
+    async def _query_collection(self, collection_name: str, **query) -> Dict[str, any]:
+        """Query a collection on a worker thread (Chroma's client is synchronous)"""
+        collection = self._get_collection(collection_name)
+        try:
+            return await asyncio.to_thread(collection.query, **query)
+        except Exception:
+            # Re-ingesting a repository in another process deletes and recreates
+            # its collection, leaving this handle stale; look it up again once
+            self._collections.pop(collection_name, None)
+            return await asyncio.to_thread(self._get_collection(collection_name).query, **query)
+    
+    async def embed_texts(self, texts: List[str]) -> List[List[float]]:
+        """Embed texts with the service's model (e.g. to key caches on queries)"""
+        return await self._embed_queries(texts)
+    
+    async def _embed_queries(self, queries: List[str]) -> List[List[float]]:
+        """Embed query strings through the LRU + TTL query cache; misses go to the model in one batch"""
+        now = time.monotonic()
+        ttl = settings.QUERY_EMBEDDING_CACHE_TTL
+        embeddings: List[Optional[List[float]]] = [None] * len(queries)
+        misses: Dict[bytes, List[int]] = {}
+        
+        with self._query_cache_lock:
+            for i, query in enumerate(queries):
+                key = blake2b(query.encode('utf-8'), digest_size=16).digest()
+                entry = self._query_cache.get(key)
+                if entry is not None and now - entry[0] <= ttl:
+                    self._query_cache.move_to_end(key)
+                    embeddings[i] = entry[1]
+                else:
+                    misses.setdefault(key, []).append(i)
+        
+        if misses:
+            computed = await self._generate_embeddings([queries[indices[0]] for indices in misses.values()])
+            with self._query_cache_lock:
+                for (key, indices), embedding in zip(misses.items(), computed):
+                    self._query_cache[key] = (now, embedding)
+                    self._query_cache.move_to_end(key)
+                    for i in indices:
+                        embeddings[i] = embedding
+                while len(self._query_cache) > settings.QUERY_EMBEDDING_CACHE_SIZE:
+                    self._query_cache.popitem(last=False)
+        
+        return embeddings
+    
+    def _encode(self, texts: List[str]) -> List[List[float]]:
+        """Run the embedding model on one batch (called from a worker thread)"""
+        embeddings = []
+        for start, end in self._char_budget_slices(texts, settings.EMBEDDING_BATCH_MAX_CHARS):
+            embeddings.extend(self._encode_slice(texts[start:end], settings.EMBEDDING_BATCH_SIZE))
+        return embeddings
+    
+    async def _chunk_batches(
+        self, documents: List[Dict[str, any]]
+    ) -> AsyncIterator[Tuple[List[str], List[str], List[Dict[str, any]]]]:
+        """Split documents into chunks, yielding (ids, contents, metadatas) of WRITE_BATCH_SIZE"""
+        ids, contents, metadatas = [], [], []
+        for doc in documents:
+            # Split document into chunks
+            chunks = await self.text_splitter.split_code(
+                await load_content(doc), 
+                doc['language'],
+                doc['path']
+            )
+            
+            for i, chunk in enumerate(chunks):
+                contents.append(chunk.content)
+                metadatas.append({
+                    'file_path': doc['path'],
+                    'language': doc['language'],
+                    'chunk_index': i,
+                    'chunk_type': chunk.type,
+                    'start_line': chunk.start_line,
+                    'end_line': chunk.end_line,
+                    # Stored so context building never re-tokenizes retrieved chunks
+                    'token_count': self.count_tokens(chunk.content)
+                })
+                ids.append(str(uuid.uuid4()))
+                
+                if len(ids) == WRITE_BATCH_SIZE:
+                    yield ids, contents, metadatas
+                    ids, contents, metadatas = [], [], []
+        
+        if ids:
+            yield ids, contents, metadatas
+    
+    async def _embed_chunks(self, chunks: List[str], pool=None) -> Tuple[List[List[float]], int, int]:
+        """Embed one write batch; returns embeddings, unique chunk count and cache hits"""
+        # Identical chunks (empty __init__.py, licenses, generated stubs) are
+        # looked up and embedded once, then shared by every occurrence. Repeats
+        # in later batches of the same ingest are served by the cache
+        unique_index = {}
+        for chunk in chunks:
+            unique_index.setdefault(chunk, len(unique_index))
+        unique_chunks = list(unique_index)
+        
+        # Reuse cached embeddings, only unchanged-content misses hit the model
+        unique_embeddings = await self.embedding_cache.get_many(unique_chunks)
+        misses = [i for i, embedding in enumerate(unique_embeddings) if embedding is None]
+        
+        miss_texts = [unique_chunks[i] for i in misses]
+        if pool is not None and miss_texts:
+            miss_embeddings = await asyncio.to_thread(self._encode_with_pool, miss_texts, pool)
+        else:
+            # The batcher windows them into model-sized batches
+            miss_embeddings = await self._generate_embeddings(miss_texts)
+        for i, embedding in zip(misses, miss_embeddings):
+            unique_embeddings[i] = embedding
+        
+        await self.embedding_cache.set_many(miss_texts, miss_embeddings)
+        
+        embeddings = [unique_embeddings[unique_index[chunk]] for chunk in chunks]
+        return embeddings, len(unique_chunks), len(unique_chunks) - len(misses)
+    
+    async def _enqueue_batch(self, queue: asyncio.Queue, writer: asyncio.Task, batch):
+        """Put a batch on the write queue, re-raising the writer's error if it stopped"""
+        put = asyncio.ensure_future(queue.put(batch))
+        await asyncio.wait({put, writer}, return_when=asyncio.FIRST_COMPLETED)
+        if not put.done():
+            put.cancel()
+        if writer.done():
+            # Raises the write error; a clean finish only happens after None
+            writer.result()
+    
+    async def _write_batches(self, collection, queue: asyncio.Queue):
+        """Add queued (ids, documents, embeddings, metadatas) batches until None arrives"""
+        while True:
+            batch = await queue.get()
+            if batch is None:
+                return
+            ids, documents, embeddings, metadatas = batch
+            # Chroma writes are blocking; keep them off the event loop
+            await asyncio.to_thread(
+                collection.add,
+                documents=documents,
+                embeddings=embeddings,
+                metadatas=metadatas,
+                ids=ids
+            )
+    
+    async def _start_embedding_pool(self):
+        """Start a multi-process encoding pool, or None if processes cannot be spawned here"""
+        try:
+            return await asyncio.to_thread(self.embedding_model.start_multi_process_pool)
+        except (AssertionError, OSError) as e:
+            # e.g. daemonic worker processes may not have children
+            logger.warning(f"Embedding process pool unavailable, encoding in-process: {str(e)}")
+            self._embedding_pool_disabled = True
+            return None
+    
+    def _encode_with_pool(self, texts: List[str], pool) -> List[List[float]]:
+        """Encode texts on a started multi-process pool"""
+        embeddings = self.embedding_model.encode_multi_process(
+            texts, pool, batch_size=settings.EMBEDDING_BATCH_SIZE
+        )
+        # encode_multi_process has no normalize_embeddings option
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        return (embeddings / np.maximum(norms, 1e-12)).tolist()
+    
+    def _char_budget_slices(self, texts: List[str], max_chars: int) -> List[Tuple[int, int]]:
+        """Split texts into contiguous index ranges whose total length stays under max_chars"""
+        slices = []
+        start = 0
+        chars = 0
+        for i, text in enumerate(texts):
+            if i > start and chars + len(text) > max_chars:
+                slices.append((start, i))
+                start, chars = i, 0
+            chars += len(text)
+        if start < len(texts):
+            slices.append((start, len(texts)))
+        return slices
+    
+    def _encode_slice(self, texts: List[str], batch_size: int) -> List[List[float]]:
+        """Encode texts, halving the model batch size when the device runs out of memory"""
+        try:
+            return self.embedding_model.encode(
+                texts,
+                batch_size=batch_size,
+                normalize_embeddings=True,
+                convert_to_numpy=True,
+                show_progress_bar=False
+            ).tolist()
+        except RuntimeError as e:
+            # torch.cuda.OutOfMemoryError subclasses RuntimeError
+            if 'out of memory' not in str(e).lower() or batch_size <= 1:
+                raise
+            logger.warning(f"Embedding OOM at batch size {batch_size}, retrying with {batch_size // 2}")
+            self._release_device_memory()
+            return self._encode_slice(texts, batch_size // 2)
+    
+    def _release_device_memory(self):
+        """Return cached CUDA blocks to the allocator after an OOM"""
+        try:
+            import torch
+            if torch.cuda.is_available():
+                torch.cuda.empty_cache()
+        except ImportError:
+            pass
+    
     async def _generate_embeddings(self, texts: List[str]) -> List[List[float]]:
         """Generate embeddings for texts"""
         try:
-            loop = asyncio.get_event_loop()
-            embeddings = await loop.run_in_executor(
-                self.executor,
-                self.embedding_model.encode,
-                texts
-            )
-            return embeddings.tolist()
+            return await self.embedding_batcher.submit(texts)
         except Exception as e:
             logger.error(f"Error generating embeddings: {str(e)}")
             raise
     
     def count_tokens(self, text: str) -> int:
-        """Count tokens in text"""
+        """Count tokens in text, memoized per distinct string"""
+        return self._cached_token_count(text)
+    
+    def _token_count(self, text: str) -> int:
         if self.tokenizer:
             return len(self.tokenizer.encode(text))
         else:
@@ -174,6 +509,7 @@ class VectorService:
     
     async def delete_collection(self, collection_name: str):
         """Delete a vector collection"""
+        self._collections.pop(collection_name, None)
         try:
             self.client.delete_collection(name=collection_name)
             logger.info(f"Deleted collection: {collection_name}")
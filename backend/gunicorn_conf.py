@@ -0,0 +1,22 @@
+"""Gunicorn settings for the API: one uvicorn worker process per core"""
+import multiprocessing
+import os
+
+bind = os.getenv("BIND", "0.0.0.0:8000")
+worker_class = "uvicorn.workers.UvicornWorker"  # uvloop and httptools via uvicorn[standard]
+workers = int(os.getenv("WEB_CONCURRENCY", max(2, multiprocessing.cpu_count())))
+timeout = int(os.getenv("WORKER_TIMEOUT", 120))
+
+# Import the app (torch, chromadb, tokenizers) once in the master and fork it.
+# Every client that opens sockets or files (database pools, Chroma, the
+# embedding model, OpenAI) is created lazily, so each worker opens its own
+preload_app = True
+
+
+def post_fork(server, worker):
+    """Drop database pool state inherited from the master"""
+    from app.core.database import async_engine, engine
+
+    # close=False leaves any connections the master holds for it to keep using
+    engine.dispose(close=False)
+    async_engine.sync_engine.dispose(close=False)